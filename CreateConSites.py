@@ -20,6 +20,20 @@
 from Helper import *
 from arcpy.sa import *
 import re # support for regular expressions
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Projection info for Biotics extracts. These are constant, so they are built once at import.
+srVaLambert = arcpy.SpatialReference()
+srVaLambert.loadFromString("PROJCS['NAD_1983_Virginia_Lambert',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Lambert_Conformal_Conic'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-79.5],PARAMETER['Standard_Parallel_1',37.0],PARAMETER['Standard_Parallel_2',39.5],PARAMETER['Latitude_Of_Origin',36.0],UNIT['Meter',1.0]]")
+srWebMercator = arcpy.SpatialReference()
+srWebMercator.loadFromString("PROJCS['WGS_1984_Web_Mercator_Auxiliary_Sphere',GEOGCS['GCS_WGS_1984',DATUM['D_WGS_1984',SPHEROID['WGS_1984',6378137.0,298.257223563]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Mercator_Auxiliary_Sphere'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',0.0],PARAMETER['Standard_Parallel_1',0.0],PARAMETER['Auxiliary_Sphere_Type',0.0],UNIT['Meter',1.0]]")
+bioticsTransform = "WGS_1984_(ITRF00)_To_NAD_1983"
+
+# Regex patterns for parsing NWI codes. Codes are plain ASCII.
+# Full pattern, with the secondary type of mixed map units (e.g., PFO1/EM1A) captured in an optional group following the primary class
+nwiCodePat = re.compile(r'^(M|E|R|L|P)([1-5])?(RB|UB|AB|RS|US|EM|ML|SS|FO|RF|SB)?([1-7])?(?:/([1-7])?(RB|UB|AB|RS|US|EM|ML|SS|FO|RF|SB)?([1-7])?)?([A-V])?(.*)$', re.ASCII)
+# Pattern for final modifiers warranting exclusion from natural systems
+nwiExclPat = re.compile(r'(f|r|s|x)', re.IGNORECASE | re.ASCII)
 
 
 ### Functions for input data preparation and output data review ###
@@ -40,14 +54,9 @@ def ExtractBiotics(BioticsPF, BioticsCS, outGDB, ext=None):
    # Inform user
    printMsg('Patience grasshopper; this will take a few minutes...')
    
-   # Projection info
-   outCoordSyst = "PROJCS['NAD_1983_Virginia_Lambert',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Lambert_Conformal_Conic'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-79.5],PARAMETER['Standard_Parallel_1',37.0],PARAMETER['Standard_Parallel_2',39.5],PARAMETER['Latitude_Of_Origin',36.0],UNIT['Meter',1.0]]"
-   transformMethod = "WGS_1984_(ITRF00)_To_NAD_1983"
-   inCoordSyst = "PROJCS['WGS_1984_Web_Mercator_Auxiliary_Sphere',GEOGCS['GCS_WGS_1984',DATUM['D_WGS_1984',SPHEROID['WGS_1984',6378137.0,298.257223563]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Mercator_Auxiliary_Sphere'],PARAMETER['False_Easting',0.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',0.0],PARAMETER['Standard_Parallel_1',0.0],PARAMETER['Auxiliary_Sphere_Type',0.0],UNIT['Meter',1.0]]"
-
    # Set up extent boxes (note the projection for PF extent)
    if ext is not None:
-      extpf = ext.projectAs(inCoordSyst, transformMethod)
+      extpf = ext.projectAs(srWebMercator, bioticsTransform)
       printMsg("Extracting layers for map extent only.")
    else:
       extpf = None
@@ -69,7 +78,7 @@ def ExtractBiotics(BioticsPF, BioticsCS, outGDB, ext=None):
    # Process: Project
    printMsg('Projecting ProcFeats features...')
    outPF = outGDB + os.sep + 'ProcFeats_' + ts
-   arcpy.Project_management(unprjPF, outPF, outCoordSyst, transformMethod, inCoordSyst, "PRESERVE_SHAPE", "")
+   arcpy.Project_management(unprjPF, outPF, srVaLambert, bioticsTransform, srWebMercator, "PRESERVE_SHAPE", "")
    printMsg('Procedural Features successfully exported to %s' %outPF)
    
    # Summarize number of EOs by element for use in B-rank automation. 
@@ -85,12 +94,23 @@ def ExtractBiotics(BioticsPF, BioticsCS, outGDB, ext=None):
    
    return (outPF, outCS)
 
-def ParseSiteTypes(in_ProcFeats, in_ConSites, out_GDB):
+def _run_select(input, query, outGDB, outName):
+   '''Worker function for ParseSiteTypes. Runs a single Select in its own process, writing to its own geodatabase since concurrent schema writes to a shared one are unsafe. It must stay at module level to be picklable.'''
+   import arcpy
+   arcpy.env.overwriteOutput = True
+   arcpy.env.parallelProcessingFactor = "0" # avoid oversubscribing cores already used by sibling workers
+   arcpy.management.CreateFileGDB(os.path.dirname(outGDB), os.path.basename(outGDB))
+   output = outGDB + os.sep + outName
+   arcpy.analysis.Select(input, output, query)
+   return output
+
+def ParseSiteTypes(in_ProcFeats, in_ConSites, out_GDB, materialize = True):
    '''Splits input Procedural Features and Conservation Sites into 3 feature classes each, one for each of site types subject to ConSite delineation and prioritization processes.
    Parameters:
    - in_ProcFeats: input feature class representing Procedural Features
    - in_ConSites: input feature class representing Conservation Sites
    - out_GDB: geodatabase in which outputs will be stored   
+   - materialize: if True (default), outputs are written as feature classes in out_GDB. If False, no data are copied; instead, feature layers with the corresponding definition queries are created and their names are returned. Use this when the outputs only need to be read within the current session.
    '''
    
    # Define some queries
@@ -126,14 +146,58 @@ def ParseSiteTypes(in_ProcFeats, in_ConSites, out_GDB):
                [in_ConSites, qry_csAHZ, csAHZ]]
                
    # Process the data
-   fcList = []
-   for item in procList:
-      input = item[0]
-      query = item[1]
-      output = item[2]
-      printMsg("Creating feature class %s" %output)
-      arcpy.Select_analysis(input, output, query)
-      fcList.append(output)
+   if not materialize:
+      fcList = []
+      for item in procList:
+         lyrName = os.path.basename(item[2])
+         printMsg("Creating feature layer %s" %lyrName)
+         arcpy.management.MakeFeatureLayer(item[0], lyrName, item[1])
+         fcList.append(lyrName)
+      return fcList
+   
+   # The selections are independent, so they are farmed out to worker processes. Workers can only see data on disk, so layers (which may carry selections or definition queries) are processed serially instead.
+   inTypes = [getDataType(fc) for fc in [in_ProcFeats, in_ConSites]]
+   if "FeatureLayer" in inTypes or out_GDB in ("in_memory", "memory"):
+      # Memory workspaces are private to each process, so outputs created there by workers would be lost
+      fcList = []
+      for item in procList:
+         input = item[0]
+         query = item[1]
+         output = item[2]
+         printMsg("Creating feature class %s" %output)
+         arcpy.Select_analysis(input, output, query)
+         fcList.append(output)
+   else:
+      setPythonExecutable()
+      numWorkers = min(len(procList), os.cpu_count() or 1)
+      printMsg("Creating %s feature classes using %s worker processes..." %(len(procList), numWorkers))
+      ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+      workerGDBs = []
+      failList = []
+      with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+         futures = {}
+         for i, item in enumerate(procList):
+            workerGDB = arcpy.env.scratchFolder + os.sep + "parse_%s_%s.gdb" %(ts, i)
+            workerGDBs.append(workerGDB)
+            futures[executor.submit(_run_select, item[0], item[1], workerGDB, os.path.basename(item[2]))] = i
+         for f in as_completed(futures):
+            item = procList[futures[f]]
+            try:
+               arcpy.management.CopyFeatures(f.result(), item[2])
+               printMsg("Created feature class %s" %item[2])
+            except:
+               printWrng("Worker process failed to create feature class %s" %item[2])
+               tback()
+               failList.append(item)
+      
+      # The workers have shut down by now, so their geodatabases are no longer locked
+      garbagePickup(workerGDBs)
+      
+      # Retry any failures here, so the outputs are either complete or the error is raised from this process
+      for item in failList:
+         printMsg("Creating feature class %s" %item[2])
+         arcpy.Select_analysis(item[0], item[2], item[1])
+      fcList = [item[2] for item in procList]
    
    return fcList
    
@@ -155,11 +219,29 @@ def TabParseNWI(inNWI, outTab):
 
    The output table can be joined back to the NWI polygons using the ATTRIBUTE field as the key.
    
+   If the input already contains the parsed attribute fields now provided by NWI (SYSTEM_NAME, etc.), no parsing is done; the output table instead summarizes the codes along with those fields.
+   
    Parameters:
    - inNWI: Input NWI polygon feature class
    - outTab: Output table containing one record for each unique code in the ATTRIBUTE field
    '''
    
+   # Skip parsing if the input already has the parsed attributes
+   parsedFlds = ["SYSTEM_NAME", 
+                 "SUBSYSTEM_NAME", 
+                 "CLASS_NAME", 
+                 "SUBCLASS_NAME",
+                 "SPLIT_CLASS_NAME",
+                 "SPLIT_SUBCLASS_NAME", 
+                 "WATER_REGIME_SUBGROUP", 
+                 "FIRST_MODIFIER_NAME",
+                 "SECOND_MODIFIER_NAME"]
+   if "SYSTEM_NAME" in [f.name for f in arcpy.ListFields(inNWI)]:
+      printMsg('Input already contains parsed NWI attributes. Generating table with unique NWI codes and attributes...')
+      arcpy.Statistics_analysis(inNWI, outTab, "ACRES SUM", ";".join(["ATTRIBUTE"] + parsedFlds))
+      printMsg('Mission accomplished.')
+      return outTab
+   
    # Generate the initial table containing one record for each ATTRIBUTE value
    printMsg('Generating table with unique NWI codes...')
    arcpy.Statistics_analysis(inNWI, outTab, "ACRES SUM", "ATTRIBUTE;WETLAND_TYPE")
@@ -176,22 +258,10 @@ def TabParseNWI(inNWI, outTab):
               ('WtrReg', 50), 
               ('Mods', 5), 
               ('Exclude', 1)]
-   flds = ["ATTRIBUTE"] # initializes master field list for later use
-   for Fld in FldList:
-      FldName = Fld[0]
-      FldLen = Fld[1]
-      flds.append(FldName)
-      arcpy.AddField_management(outTab, FldName, 'TEXT', '', '', FldLen, '', 'NULLABLE', '', '')
-   
-   printMsg('Setting up some regex patterns and code dictionaries...')
-   # Set up some patterns to match
-   mix_mu = re.compile(r'/([1-7])?(RB|UB|AB|RS|US|EM|ML|SS|FO|RF|SB)?([1-7])?')
-   # pattern for mixed map units
-   full_pat =  re.compile(r'^(M|E|R|L|P)([1-5])?(RB|UB|AB|RS|US|EM|ML|SS|FO|RF|SB)?([1-7])?([A-V])?(.*)$') 
-   # full pattern after removing secondary type
-   ex_pat = re.compile(r'(f|r|s|x)', re.IGNORECASE)
-   # pattern for final modifiers warranting exclusion from natural systems
+   flds = ["ATTRIBUTE"] + [Fld[0] for Fld in FldList] # initializes master field list for later use
+   arcpy.management.AddFields(outTab, [[FldName, 'TEXT', '', FldLen, '', ''] for FldName, FldLen in FldList])
    
+   printMsg('Setting up code dictionaries...')
    ### Set up a bunch of dictionaries, using the NWI code diagram for reference.
    # https://www.fws.gov/wetlands/documents/NWI_Wetlands_and_Deepwater_Map_Code_Diagram.pdf 
    # This code section reviewed/updated against diagram published in February 2019.
@@ -298,81 +368,63 @@ def TabParseNWI(inNWI, outTab):
            'T': ('Freshwater Tidal', 'Semipermanently Flooded-Fresh Tidal'),
            'V': ('Freshwater Tidal', 'Permanently Flooded-Fresh Tidal')}
    
-   # Loop through the records and assign field attributes based on NWI codes
-   printMsg('Looping through the NWI codes to parse...')
-   printMsg('Fields: %s'%flds)
-   with arcpy.da.UpdateCursor(outTab, flds) as cursor:
-      for row in cursor:
-         nwiCode = row[0] 
-         printMsg('Code: %s' % nwiCode)
-         
-         # First, for mixed map units, extract the secondary code portion from the code string
-         m = mix_mu.search(nwiCode)
-         if m:
-            extract = m.group()
-            nwiCode = nwiCode.replace(extract, '')
-         
-         # Parse out the primary sub-codes
-         s = full_pat.search(nwiCode)
-         h1 = s.group(1) # System code
-         h2 = s.group(2) # Subsystem code
-         h3 = s.group(3) # Class code
-         h4 = s.group(4) # Subclass code
-         mod1 = s.group(5) # Water Regime code
-         row[9] = s.group(6) # Additional modifier code(s) go directly into Mods field
-         if s.group(6):
-            x = ex_pat.search(s.group(6))
-            if x:
-               row[10] = 'X' # Flags record for exclusion from natural(ish) systems
-         
-         # Assign attributes to primary fields by extracting from dictionaries
-         row[1] = (dSyst[h1])[0] # Syst field
-         try:
-            row[2] = ((dSyst[h1])[1])[h2] # Subsyst field
-         except:
-            row[2] = None 
-         try:
-            row[3] = (dCls[h3])[0] # Cls1 field
-         except:
-            row[3] = None
-         try:
-            row[4] = ((dCls[h3])[1])[h4] # Subcls1 field
-         except:
-            row[4] = None
-         try:
-            row[7] = (dWtr[mod1])[0] # Tidal field
-         except:
-            row[7] = None
-         try:
-            row[8] = (dWtr[mod1])[1] # WtrReg field
-         except:
-            row[8] = None
-
-         # If applicable, assign attributes to secondary fields by extracting from dictionaries
-         if m:
-            if m.group(1):
-               h4_2 = m.group(1) # Secondary subclass code
-            elif m.group(3):
-               h4_2 = m.group(3)
-            else:
-               h4_2 = None
-            if m.group(2):
-               h3_2 = m.group(2) # Secondary class code
-            else:
-               h3_2 = None
-            try:
-               row[5] = (dCls[h3_2])[0] # Cls2 field
-            except:
-               row[5] = None
-            try:
-               row[6] = ((dCls[h3_2])[1])[h4_2] # Subcls2 field; requires secondary class for definition of subclass
-            except:
-               try:
-                  row[6] = ((dCls[h3])[1])[h4_2] # If no secondary class, use primary class for subclass definition
-               except:
-                  row[6] = None   
-            
-         cursor.updateRow(row)
+   # Flatten the nested dictionaries so lookups can be done on concatenated codes
+   dSystName = {k: v[0] for k, v in dSyst.items()}
+   dSubsyst = {k + k2: v2 for k, v in dSyst.items() if v[1] for k2, v2 in v[1].items()}
+   dClsName = {k: v[0] for k, v in dCls.items()}
+   dSubcls = {k + k2: v2 for k, v in dCls.items() for k2, v2 in v[1].items()}
+   dTidal = {k: v[0] for k, v in dWtr.items()}
+   dWtrReg = {k: v[1] for k, v in dWtr.items()}
+   
+   def lookupChars(d, *codes):
+      '''Looks up codes built from single characters (one Series per character position) in an array indexed by character code, rather than hashing each value. Missing codes yield nulls.'''
+      lut = numpy.full((128,) * len(codes), None, dtype=object)
+      for k, v in d.items():
+         lut[tuple(ord(c) for c in k)] = v
+      idx = tuple(numpy.frombuffer(c.fillna('\x00').str.cat().encode('ascii'), dtype=numpy.uint8) for c in codes)
+      return pandas.Series(lut[idx], index=codes[0].index)
+   
+   # Parse all the NWI codes at once, rather than looping through records
+   printMsg('Parsing the NWI codes...')
+   statFlds = ["ATTRIBUTE", "WETLAND_TYPE", "FREQUENCY", "SUM_ACRES"]
+   statRows = [row for row in arcpy.da.SearchCursor(outTab, statFlds)]
+   df = pandas.DataFrame(statRows, columns=statFlds)
+   
+   # Parse out the primary and (for mixed map units) secondary sub-codes in a single regex pass
+   s = df["ATTRIBUTE"].str.extract(nwiCodePat)
+   h1 = s[0] # System code
+   h2 = s[1] # Subsystem code
+   h3 = s[2] # Class code
+   h4 = s[3] # Subclass code
+   h4_2 = s[4].fillna(s[6]) # Secondary subclass code
+   h3_2 = s[5] # Secondary class code
+   mod1 = s[7] # Water Regime code
+   mods = s[8] # Additional modifier code(s) go directly into Mods field
+   
+   # Assign attributes by looking up codes in the dictionaries. Codes not found yield nulls.
+   # Single-character codes use lookup arrays; two-letter class codes are mapped through the dictionaries.
+   out = pandas.DataFrame({
+      'Syst': lookupChars(dSystName, h1),
+      'Subsyst': lookupChars(dSubsyst, h1, h2),
+      'Cls1': h3.map(dClsName),
+      'Subcls1': (h3 + h4).map(dSubcls),
+      'Cls2': h3_2.map(dClsName),
+      # Subclass requires secondary class for definition; if no secondary class, use primary class
+      'Subcls2': (h3_2 + h4_2).map(dSubcls).fillna((h3 + h4_2).map(dSubcls)),
+      'Tidal': lookupChars(dTidal, mod1),
+      'WtrReg': lookupChars(dWtrReg, mod1),
+      'Mods': mods,
+      # Flags record for exclusion from natural(ish) systems
+      'Exclude': mods.str.contains(nwiExclPat, na=False).map({True: 'X', False: None})})
+   out = out[flds[1:]].astype(object)
+   out = out.where(out.notna(), None)
+   
+   # Rewrite the table with the summary and parsed values together, as a single append-only pass
+   printMsg('Writing parsed attributes to table...')
+   arcpy.management.TruncateTable(outTab)
+   with arcpy.da.InsertCursor(outTab, statFlds + flds[1:]) as cursor:
+      for row, vals in zip(statRows, out.itertuples(index=False, name=None)):
+         cursor.insertRow(row + vals)
    printMsg('Mission accomplished.')
    return outTab
    
@@ -390,12 +442,10 @@ def RulesToNWI(inTab, inPolys):
    - inTab: Input table of NWI code definitions. (This table will be modified by the addition of binary fields.)
    - inPolys: Input NWI polygons representing wetlands. (This feature class will be modified by joining the fields from the code table).
    '''
-   # Create new fields to hold SBB rules and tidal status, and set initial values to 0
-   printMsg('Adding and initializing SBB rule and tidal status fields...')
+   # Create new fields to hold SBB rules and tidal status. No initialization is needed, since every record is assigned 0 or 1 below.
+   printMsg('Adding SBB rule and tidal status fields...')
    RuleList = ["Rule5", "Rule6", "Rule7", "Rule9", "Tidal", "Exclude"]
-   for Rule in RuleList:
-      arcpy.AddField_management(inTab, Rule, 'SHORT')
-      arcpy.CalculateField_management(inTab, Rule, 0, "PYTHON")
+   arcpy.management.AddFields(inTab, [[Rule, 'SHORT'] for Rule in RuleList])
    
    # Create a table view including only the desired fields
    flds = ["ATTRIBUTE", 
@@ -417,68 +467,51 @@ def RulesToNWI(inTab, inPolys):
       fieldinfo.addField(f, f, "VISIBLE", "")
    arcpy.management.MakeTableView(inTab, "nwiCodeTab", "", "", fieldinfo)
    
-   # Loop through the records and assign rules
+   # Assign rules to all records at once, using boolean masks rather than looping through records
    printMsg('Examining NWI codes and assigning rules...')
    exclList = ["Farmed", "Artificial Substrate", "Excavated", "Spoil"]
-   with arcpy.da.UpdateCursor(inTab, flds) as cursor:
+   vegList = ['Emergent', 'Scrub-Shrub', 'Forested']
+   vegSubList = ['Rooted Vascular', 'Floating Vascular', 'Vegetated']
+   codeFlds = ["OID@"] + flds[1:10]
+   df = pandas.DataFrame([row for row in arcpy.da.SearchCursor(inTab, codeFlds)], columns=codeFlds)
+   syst = df["SYSTEM_NAME"]
+   cls1 = df["CLASS_NAME"]
+   subcls1 = df["SUBCLASS_NAME"]
+   cls2 = df["SPLIT_CLASS_NAME"]
+   subcls2 = df["SPLIT_SUBCLASS_NAME"]
+   wtrReg = df["WATER_REGIME_SUBGROUP"]
+   
+   # Excluded records get no other attributes
+   excl = df["FIRST_MODIFIER_NAME"].isin(exclList) | df["SECOND_MODIFIER_NAME"].isin(exclList)
+   
+   # Tidal records: Rule 9 applies to vegetated, non-marine types
+   tidal = wtrReg.isin(["Saltwater Tidal", "Freshwater Tidal"]) & ~excl
+   veg = (cls1.isin(vegList) | cls2.isin(vegList) | 
+          ((cls1 == 'Aquatic Bed') & subcls1.isna()) | 
+          ((cls2 == 'Aquatic Bed') & subcls2.isna()) | 
+          subcls1.isin(vegSubList) | subcls2.isin(vegSubList))
+   rule9 = tidal & syst.notna() & (syst != 'Marine') & veg
+   
+   # Nontidal records: Lacustrine gets Rules 6 and 7; Palustrine depends on class
+   nontidal = (wtrReg == 'Nontidal') & ~excl
+   lac = nontidal & (syst == 'Lacustrine')
+   pal = nontidal & (syst == 'Palustrine')
+   woody = cls1.isin(vegList) | cls2.isin(vegList)
+   emerg = (cls1 == 'Emergent') | (cls2 == 'Emergent')
+   rule5 = pal & woody
+   rule67 = lac | (pal & (emerg | ~woody))
+   
+   rules = pandas.DataFrame({"Rule5": rule5, 
+                             "Rule6": rule67, 
+                             "Rule7": rule67, 
+                             "Rule9": rule9, 
+                             "Tidal": tidal, 
+                             "Exclude": excl}).astype(int)
+   ruleDict = dict(zip(df["OID@"].tolist(), rules[RuleList].itertuples(index=False, name=None)))
+   
+   with arcpy.da.UpdateCursor(inTab, ["OID@"] + RuleList) as cursor:
       for row in cursor:
-         # Get the values from relevant fields
-         nwiCode = row[0]
-         syst = row[1]
-         subsyst = row[2]
-         cls1 = row[3]
-         subcls1 = row[4]
-         cls2 = row[5]
-         subcls2 = row[6]
-         wtrReg = row[7]
-         mod1 = row[8]
-         mod2 = row[9]
-         rule5 = row[10]
-         rule6 = row[11]
-         rule7 = row[12]
-         rule9 = row[13]
-         tidal = row[14]
-         excl = row[15]
-         
-         # Update the values of SBB rule fields based on various criteria
-         if mod1 in exclList or mod2 in exclList:
-            row[15] = 1 # Exclude
-            continue # Skip all the rest and go on to process the next record
-         if wtrReg in ("Saltwater Tidal", "Freshwater Tidal"):
-            row[14] = 1 # Set to tidal
-            if syst == 'Marine' or syst is None:
-               pass # No rule assigned
-            else:
-               if (cls1 in ('Emergent', 'Scrub-Shrub', 'Forested') or
-                     cls2 in ('Emergent', 'Scrub-Shrub', 'Forested') or
-                     cls1 == 'Aquatic Bed' and subcls1 is None or
-                     cls2 == 'Aquatic Bed' and subcls2 is None or
-                     subcls1 in ('Rooted Vascular', 'Floating Vascular', 'Vegetated') or
-                     subcls2 in ('Rooted Vascular', 'Floating Vascular', 'Vegetated')):
-                  row[13] = 1 # Assign Rule 9
-               else:
-                  pass # No rule assigned
-         elif wtrReg == 'Nontidal':
-            if syst == 'Lacustrine':
-               row[11] = 1 # Assign Rule 6
-               row[12] = 1 # Assign Rule 7
-            elif syst == 'Palustrine':
-               if (cls1 in ('Emergent', 'Scrub-Shrub', 'Forested') or cls2 in ('Emergent', 'Scrub-Shrub', 'Forested')):
-                  if (cls1 == 'Emergent' or cls2 == 'Emergent'):
-                     row[10] = 1 # Assign Rule 5
-                     row[11] = 1 # Assign Rule 6
-                     row[12] = 1 # Assign Rule 7
-                  else:
-                     row[10] = 1 # Assign Rule 5
-               else:
-                  row[11] = 1 # Assign Rule 6
-                  row[12] = 1 # Assign Rule 7
-            else:
-               pass # No rule assigned
-         else:
-            pass # No rule assigned
-         
-         cursor.updateRow(row)
+         cursor.updateRow([row[0]] + list(ruleDict[row[0]]))
    
    # Join fields from codes table to polygons
    printMsg("Joining attribute fields from code table to polygons...")
@@ -511,22 +544,24 @@ def prepFlowBuff(in_FlowDist, truncDist, procMask, out_Rast, snapRast = None):
    
    # Cast string as raster
    in_FlowDist = Raster(in_FlowDist)
+   noData = in_FlowDist.noDataValue
    
-   # Convert nulls to zero
-   printMsg("Converting nulls to zero...")
-   FlowDist = Con(IsNull(in_FlowDist),0,in_FlowDist)
-   
-   # Recode raster
-   printMsg("Recoding raster...")
-   where_clause = "VALUE > %s" %truncDist
-   buffRast = SetNull (FlowDist, 1, where_clause)
+   # Recode raster in a single pass, block by block. Nulls are treated as zero distance, so they fall within the buffer.
+   def recode(arr):
+      inBuff = arr <= truncDist
+      if noData is not None:
+         inBuff |= (arr == noData)
+      return inBuff.astype(numpy.uint8)
    
    # Reproject or save directly
    if snapRast is None:
-      printMsg("Saving raster...")
-      buffRast.save(out_Rast)
+      printMsg("Recoding and saving raster...")
+      calcRasterByBlock([in_FlowDist], recode, out_Rast, scratchGDB = scratchGDB)
    else:
-      ProjectToMatch_ras(buffRast, snapRast, out_Rast, "NEAREST")
+      printMsg("Recoding raster...")
+      tmpRast = scratchGDB + os.sep + "tmpBuffRast"
+      calcRasterByBlock([in_FlowDist], recode, tmpRast, scratchGDB = scratchGDB)
+      ProjectToMatch_ras(tmpRast, snapRast, out_Rast, "NEAREST")
    
    # Check in Spatial Analyst extention
    arcpy.CheckInExtension("Spatial")
@@ -563,12 +598,12 @@ def prepInclusionZone(in_Zone1, in_Zone2, in_Score, out_Rast, truncVal = 9):
    in_Zone2 = Raster(in_Zone2)
    in_Score = Raster(in_Score)
    
-   # Calculate zone and save
+   # Calculate zone in a single pass, block by block on the Score raster's grid, and save. The zone rasters are assumed to share its cell size and alignment.
    print("Calculating inclusion zone...")
    # r = Con(in_Zone1, 1, Con(in_Zone2, Con(in_Score >= truncVal, 1)))
-   r = Con(in_Score >= truncVal, Con(in_Zone2, 1), Con(in_Zone1, 1))
-   print("Saving...")
-   r.save(out_Rast)
+   def inclusion(sc, z1, z2):
+      return ((z1 != 0) | ((z2 != 0) & (sc >= truncVal))).astype(numpy.uint8)
+   calcRasterByBlock([in_Score, in_Zone1, in_Zone2], inclusion, out_Rast, [truncVal - 1, 0, 0])
    
    print("Mission complete.")
    return out_Rast
@@ -610,141 +645,113 @@ def ReviewConSites(auto_CS, orig_CS, cutVal, out_Sites, fld_SiteID = "SITEID", f
    # Recast cutVal as a number b/c for some reasons it's acting like text
    cutVal = float(cutVal)
    
-   # Determine how many old sites are overlapped by each automated site.  
    # Automated sites provide the output geometry
-   printMsg("Performing first spatial join...")
+   arcpy.management.CopyFeatures(auto_CS, out_Sites)
    
-   # Sort original CS by area, so the spatial join will list the largest CS first (for new sites which intersect multiple original sites)
+   # Sort original CS by area, so the largest CS is listed first (for new sites which intersect multiple original sites)
    arcpy.Sort_management(orig_CS, scratchGDB + os.sep + 'orig_CS', [["Shape_area", "DESCENDING"]])
    orig_CS = scratchGDB + os.sep + 'orig_CS'
    
-   # Use field map to add Site ID and Site Names to the output layer
-   fldmap1 = 'AssignID "AssignID" true true false 100 Text 0 0,Join,";",%s,%s,-1,-1' % (orig_CS, fld_SiteID)
-   fldmap2 = 'AssignName "AssignName" true true false 1000 Text 0 0,Join,"; ",%s,%s,-1,-1' % (orig_CS, fld_SiteName)
-   fldmap = """%s;%s""" % (fldmap1, fldmap2)
-   arcpy.analysis.SpatialJoin(auto_CS, orig_CS, out_Sites, "JOIN_ONE_TO_ONE", "KEEP_ALL", fldmap, "INTERSECT")
-   
-   # Add a field to indicate site type
-   arcpy.management.AddField(out_Sites, "ModType", "TEXT", "", "", 1)
-
-   # Get the new sites.
-   # These are automated sites with no corresponding old site
-   printMsg("Separating out brand new sites...")
-   qry = "Join_Count = 0"
-   arcpy.management.MakeFeatureLayer(out_Sites, "newLyr", qry)
-   arcpy.management.CalculateField("newLyr", "ModType", '"N"')
-
-   # Get the single and split sites.
-   # These are sites that overlap exactly one old site each. This may be a one-to-one correspondence or a split.
-   printMsg("Separating out sites that may be singles or splits...")
-   qry = "Join_Count = 1"
-   arcpy.management.MakeFeatureLayer(out_Sites, "ssLyr", qry)
-   arcpy.management.CalculateField("ssLyr", "ModType", '"S"')
-
-   # Get the merged sites.
-   # These are sites overlapping multiple old sites. Some may be pure merges, others combo merge/split sites.
-   printMsg("Separating out merged sites...")
-   qry = "Join_Count > 1"
-   arcpy.management.MakeFeatureLayer(out_Sites, "mergeLyr", qry)
-   arcpy.management.CalculateField("mergeLyr", "ModType", '"M"')
-
-   # Process: Remove extraneous fields and make new layers
-   for fld in ["Join_Count", "TARGET_FID"]:
-      try:
-         arcpy.DeleteField_management(out_Sites, fld)
-      except:
-         pass
-   qry = "ModType = 'S'"
-   arcpy.management.MakeFeatureLayer(out_Sites, "ssLyr", qry)
-   qry = "ModType = 'M'"
-   arcpy.management.MakeFeatureLayer(out_Sites, "mergeLyr", qry)
-   
-   # Determine how many automated sites are overlapped by each old site.  
-   # Old sites provide the output geometry
-   printMsg("Performing second spatial join...")
-   Join2 = scratchGDB + os.sep + "Join2"
-   arcpy.analysis.SpatialJoin(orig_CS, auto_CS, Join2, "JOIN_ONE_TO_ONE", "KEEP_COMMON", fldmap, "INTERSECT")
-   arcpy.management.JoinField(Join2, "TARGET_FID", orig_CS, "OBJECTID", "%s" %fld_SiteID)
-
-   # Make separate layers for old sites that were or were not split
-   arcpy.management.MakeFeatureLayer(Join2, "NoSplitLyr", "Join_Count = 1")
-   arcpy.management.MakeFeatureLayer(Join2, "SplitLyr", "Join_Count > 1")
-   
-   # Get the single sites (= no splits or merges; one-to-one relationship with old sites)
-   printMsg("Separating out identical and boundary-change-only sites...")
-   arcpy.management.SelectLayerByLocation("ssLyr", "INTERSECT", "NoSplitLyr", "", "NEW_SELECTION", "NOT_INVERT")
-   c = countSelectedFeatures("ssLyr")
-   if c > 0:
-      printMsg("There are %s single sites (no splits or merges)"%str(c))
-      arcpy.management.CalculateField("ssLyr", "ModType", '"B"')
-      qry = "ModType = 'B'"
-      bLyr = arcpy.management.MakeFeatureLayer(out_Sites, "bLyr", qry)
-   else:
-      bLyr = None
-   
-   # Get the subset of single sites that are identical to old sites
-   if bLyr:
-      arcpy.management.SelectLayerByLocation("bLyr", "ARE_IDENTICAL_TO", "NoSplitLyr", "", "NEW_SELECTION", "NOT_INVERT")
-      c = countSelectedFeatures("bLyr")
-      if c > 0:
-         printMsg("%s sites are identical to the old ones..."%str(c))
-         arcpy.management.CalculateField("bLyr", "ModType", '"I"')
-   else:
-      pass
+   # Enumerate the intersecting new/old site pairs with a single spatial join. 
+   # From these pairs, determine how many old sites are overlapped by each automated site, and vice versa.
+   printMsg("Enumerating intersecting pairs of new and old sites...")
+   sitePairs = scratchGDB + os.sep + "sitePairs"
+   arcpy.analysis.SpatialJoin(out_Sites, orig_CS, sitePairs, "JOIN_ONE_TO_MANY", "KEEP_COMMON", "", "INTERSECT")
+   newToOld = dict()
+   oldCounts = dict()
+   with arcpy.da.SearchCursor(sitePairs, ["TARGET_FID", "JOIN_FID"]) as cursor:
+      for newID, oldID in cursor:
+         newToOld.setdefault(newID, []).append(oldID)
+         oldCounts[oldID] = oldCounts.get(oldID, 0) + 1
+   for olds in newToOld.values():
+      olds.sort()
+   
+   # Add Site ID and Site Names of the intersecting old sites to the output layer
+   def fmtVal(val):
+      if val is None:
+         return ""
+      if isinstance(val, float) and val.is_integer():
+         val = int(val)
+      return str(val)
+   oldAttribs = {row[0]: (fmtVal(row[1]), fmtVal(row[2])) for row in arcpy.da.SearchCursor(orig_CS, ["OID@", fld_SiteID, fld_SiteName])}
+   arcpy.management.AddFields(out_Sites, [["AssignID", "TEXT", "", 100], ["AssignName", "TEXT", "", 1000]])
+   with arcpy.da.UpdateCursor(out_Sites, ["OID@", "AssignID", "AssignName"]) as cursor:
+      for row in cursor:
+         olds = newToOld.get(row[0])
+         if olds:
+            row[1] = ";".join([oldAttribs[o][0] for o in olds])[:100]
+            row[2] = "; ".join([oldAttribs[o][1] for o in olds])[:1000]
+            cursor.updateRow(row)
+   
+   # Determine which new sites overlap old sites that were or were not split
+   oids = arcpy.da.TableToNumPyArray(out_Sites, ["OID@"])["OID@"]
+   oldIDs = [newToOld.get(i, []) for i in oids]
+   noSplit = numpy.array([any(oldCounts[o] == 1 for o in olds) for olds in oldIDs], dtype=bool)
+   split = numpy.array([any(oldCounts[o] > 1 for o in olds) for olds in oldIDs], dtype=bool)
+   
+   # Classify all sites at once, based on the number of old sites overlapped by each new site
+   printMsg("Classifying sites...")
+   # N: brand new sites, with no corresponding old site
+   # S: sites overlapping exactly one old site each. This may be a one-to-one correspondence or a split.
+   # M: sites overlapping multiple old sites. Some may be pure merges, others combo merge/split sites.
+   jc = numpy.array([len(olds) for olds in oldIDs])
+   modType = numpy.where(jc == 0, "N", numpy.where(jc == 1, "S", "M"))
+   
+   # B: single sites (= no splits or merges; one-to-one relationship with old sites)
+   isB = (modType == "S") & noSplit
+   modType[isB] = "B"
+   printMsg("There are %s single sites (no splits or merges)" % str(isB.sum()))
+   
+   # C: combo split-merge sites
+   isC = (modType == "M") & split
+   modType[isC] = "C"
+   printMsg("There are %s combo split-merge sites" % str(isC.sum()))
+   
+   printMsg("Examining boundary changes for single sites...")
+   # Compare each single site to its old site, to find identical sites and calculate PercDiff for Boundary Change only sites. 
+   # The area that differs (symmetric difference) is derived as new area + old area - 2 * intersection area, so only the intersection needs to be computed.
+   percDiff = dict()
+   ident = set()
+   if isB.any():
+      # Match each B site to its old site, from the intersecting pairs
+      oldOIDs = {int(oids[i]): oldIDs[i][0] for i in numpy.flatnonzero(isB)}
+      # Cache shapes and areas of only those old sites, in a single cursor pass
+      qry = "%s IN (%s)" % (GetFlds(orig_CS, oid_only=True), ",".join([str(i) for i in oldOIDs.values()]))
+      oldCache = {row[0]: (row[1], row[1].area) for row in arcpy.da.SearchCursor(orig_CS, ["OID@", "SHAPE@"], qry)}
+      qry = "%s IN (%s)" % (GetFlds(out_Sites, oid_only=True), ",".join([str(i) for i in oldOIDs.keys()]))
+      with arcpy.da.SearchCursor(out_Sites, ["OID@", "SHAPE@"], qry) as cursor:
+         for row in cursor:
+            newShape = row[1]
+            oldShape, oldArea = oldCache[oldOIDs[row[0]]]
+            # Intersect the new/old pair in memory, and compare the difference area to old site area
+            intArea = newShape.intersect(oldShape, 4).area
+            pd = 100 * (newShape.area + oldArea - 2 * intArea) / oldArea
+            # Sites with no area difference are identical to the old ones
+            if pd < 1e-9:
+               ident.add(row[0])
+            else:
+               percDiff[row[0]] = pd
    
-   # Get the combo split-merge sites
-   printMsg("Separating out combo split-merge sites...")
-   arcpy.management.SelectLayerByLocation("mergeLyr", "INTERSECT", "SplitLyr", "", "NEW_SELECTION", "NOT_INVERT")
-   c = countSelectedFeatures("mergeLyr")
-   if c > 0:
-      printMsg("There are %s combo split-merge sites"%str(c))
-      arcpy.management.CalculateField("mergeLyr", "ModType", '"C"')
-   
-   printMsg("Examining boundary changes for boundary change only sites...")
-   # Calculate PercDiff for Boundary Change only sites
-   qry = "ModType = 'B'"
-   newB = scratchGDB + os.sep + "newB"
-   arcpy.MakeFeatureLayer_management(out_Sites, "B_Lyr", where_clause=qry)
-   if countFeatures("B_Lyr") > 0:
-      arcpy.CopyFeatures_management("B_Lyr", newB)
-      arcpy.CalculateField_management(newB, "new_area", "!shape.area@squaremeters!", field_type="DOUBLE")
-      # Make layer for old sites, calculate area
-      arcpy.MakeFeatureLayer_management(orig_CS, "o_lyr")
-      arcpy.SelectLayerByLocation_management("o_lyr", "INTERSECT", newB)
-      oldB = scratchGDB + os.sep + "oldB"
-      arcpy.CopyFeatures_management("o_lyr", oldB)
-      arcpy.CalculateField_management(oldB, "old_area", "!shape.area@squaremeters!", field_type="DOUBLE")
-      # Calculate intersection
-      tmpInt = scratchGDB + os.sep + "tmpInt"
-      arcpy.PairwiseIntersect_analysis([newB, oldB], tmpInt)
-      # Sum the difference of the intersect area from both new/old sites, compare that to old site area. 
-      calc = "100 * ((!new_area! - !shape.area@squaremeters!) + (!old_area! - !shape.area@squaremeters!)) / !old_area!"
-      arcpy.CalculateField_management(tmpInt, "PercDiff", calc, field_type="DOUBLE")
-      arcpy.JoinField_management(out_Sites, "AssignID", tmpInt, "AssignID", "PercDiff")
-   
-   # Process: Add Fields; Calculate Flag Field
-   # Note that PercDiff would already be in the layer if there are "B" type sites, but ArcGIS will just ignore it in that case.
-   printMsg("Calculating fields...")
-   for fld in [("PercDiff", "DOUBLE", ""), ("Flag", "SHORT", ""), ("Comment", "TEXT", 1000)]:
-      arcpy.management.AddField(out_Sites, fld[0], fld[1], "", "", fld[2])
-   CodeBlock = """def Flag(ModType, percDiff):
-      if ModType in ("N", "M", "C", "S"):
-         flg = 1
-      elif ModType == "B":
-         if percDiff >= %s:
-            flg = 1
-         else:
-            flg = 0
-      else:
-         flg = 0
-      return flg""" % (str(cutVal))
-   Expression = "Flag(!ModType!, !PercDiff!)"
-   arcpy.management.CalculateField(out_Sites, "Flag", Expression, "PYTHON3", CodeBlock)
+   # I: the subset of single sites that are identical to old sites
+   isI = numpy.isin(oids, list(ident))
+   modType[isI] = "I"
+   printMsg("%s sites are identical to the old ones..." % str(isI.sum()))
+   
+   # Add fields to indicate site type, boundary change, and review flag, populated in a single pass. 
+   # PercDiff applies only to Boundary Change sites; it is left null for the others.
+   percArr = numpy.array([percDiff.get(int(i), numpy.nan) for i in oids], dtype=float)
+   # Flag the sites needing review: all N, M, C, and S sites, plus B sites with change at or above the threshold
+   flag = (numpy.isin(modType, ["N", "M", "C", "S"]) | ((modType == "B") & (percArr >= cutVal))).astype(numpy.int16)
+   outArr = numpy.rec.fromarrays([oids, modType, percArr, flag], names="SiteOID,ModType,PercDiff,Flag")
+   arcpy.da.ExtendTable(out_Sites, GetFlds(out_Sites, oid_only=True), outArr, "SiteOID")
+   
+   # Process: Add Comment Field
+   arcpy.management.AddField(out_Sites, "Comment", "TEXT", "", "", 1000)
    
    # Process: Update AssignID and Name for split sites, adding a sequential number based on area of new site. 
    # This should ensure that AssignName is unique.
    slyr = arcpy.MakeFeatureLayer_management(out_Sites, "slyr", "ModType IN ('S')")  # could add "C", but don't think it's necessary.
-   if countFeatures(slyr) > 0:
+   if hasFeatures(slyr):
       printMsg("Adding sequential numbers to IDs and names for split and combo sites...")
       arcpy.CalculateField_management(slyr, "tmp_area", "!Shape.area@squaremeters!", field_type="FLOAT")
       calcGrpSeq(slyr, [["tmp_area", "DESCENDING"]], "AssignID", "rnk_area")
@@ -756,6 +763,11 @@ def ReviewConSites(auto_CS, orig_CS, cutVal, out_Sites, fld_SiteID = "SITEID", f
    mlyr = arcpy.MakeFeatureLayer_management(out_Sites, "mlyr", "ModType NOT IN ('B', 'I')")
    arcpy.CalculateField_management(mlyr, "AssignID", "None")
    
+   # Cleanup, removing only the named intermediate products
+   if scratchGDB == "in_memory":
+      trashlist = [orig_CS, sitePairs]
+      garbagePickup(trashlist)
+   
    return out_Sites
 
 
@@ -814,16 +826,13 @@ def CullEraseFeats(inEraseFeats, in_Feats, PerCov, outEraseFeats, scratchGDB = "
    TabSum = scratchGDB + os.sep + os.path.basename(inEraseFeats) + "_TabSum"
    arcpy.Statistics_analysis(TabIntersect, TabSum, "PERCENTAGE SUM", "iFID")
    
-   # Process: Join Field
-   # This joins the summed percentage value back to the original input features
-   try:
-      arcpy.DeleteField_management(in_Feats, "SUM_PERCENTAGE")
-   except:
-      pass
-   arcpy.JoinField_management(in_Feats, "iFID", TabSum, "iFID", "SUM_PERCENTAGE")
-   
    # Process: Select features containing a large enough percentage of erase features
-   WhereClause = "SUM_PERCENTAGE >= %s" % PerCov
+   # The summed percentages are looked up from the summary table, rather than joined back to the input features
+   selIDs = [str(row[0]) for row in arcpy.da.SearchCursor(TabSum, ["iFID", "SUM_PERCENTAGE"]) if row[1] >= float(PerCov)]
+   if selIDs:
+      WhereClause = "iFID IN (%s)" % ",".join(selIDs)
+   else:
+      WhereClause = "1 = 0"
    selInFeats = scratchGDB + os.sep + 'selInFeats'
    arcpy.Select_analysis(in_Feats, selInFeats, WhereClause)
    
@@ -861,24 +870,22 @@ def ExpandPFselection(inPF_lyr, inCS_lyr, SearchDist):
    - SearchDist: distance within which PFs should be added to the selection
    
    '''
-   c = countSelectedFeatures(inPF_lyr)
-   if c == 0:
+   if countSelectedFeatures(inPF_lyr) == 0:
       printErr("You need to have an active selection on the PF layer for this function to work.")
       return
-   c1 = c+1
    # Loop process until no new PFs selected
-   while c < c1:
+   while True:
       # Expand selection
       inPF_lyr = ExpandSelection(inPF_lyr, SearchDist)
       c = countSelectedFeatures(inPF_lyr)
-      if inCS_lyr.lower() != "none":
-         # Select by ConSite
-         arcpy.management.SelectLayerByLocation(inCS_lyr, "INTERSECT", inPF_lyr, "", "NEW_SELECTION")
-         inPF_lyr = arcpy.management.SelectLayerByLocation(inPF_lyr, "INTERSECT", inCS_lyr, "", "ADD_TO_SELECTION")
-      else:
+      if inCS_lyr.lower() == "none":
+         break
+      # Select by ConSite
+      arcpy.management.SelectLayerByLocation(inCS_lyr, "INTERSECT", inPF_lyr, "", "NEW_SELECTION")
+      inPF_lyr = arcpy.management.SelectLayerByLocation(inPF_lyr, "INTERSECT", inCS_lyr, "", "ADD_TO_SELECTION")
+      # Check if selecting increased; ADD_TO_SELECTION can only grow the selection, so comparing sizes is enough
+      if countSelectedFeatures(inPF_lyr) == c:
          break
-      # Check if selecting increased
-      c1 = countSelectedFeatures(inPF_lyr)
    printMsg("Update: %s PFs are selected"%str(c))
    
    return inPF_lyr
@@ -899,7 +906,7 @@ def SubsetSBBandPF(inSBB, inPF, selOption, fld_SFID, outSBB, outPF):
       printErr('Invalid selection option')
      
    # If applicable, clear any selections on the Selectee input
-   typeSelectee = (arcpy.Describe(inSelectee)).dataType
+   typeSelectee = getDataType(inSelectee)
    if typeSelectee == 'FeatureLayer':
       arcpy.SelectLayerByAttribute_management(inSelectee, "CLEAR_SELECTION")
       
@@ -909,14 +916,21 @@ def SubsetSBBandPF(inSBB, inPF, selOption, fld_SFID, outSBB, outPF):
    # Make Feature Layer from Selectee features
    arcpy.MakeFeatureLayer_management(inSelectee, "Selectee_lyr") 
 
-   # Get the Selectees associated with the Selectors, keeping only common records
-   arcpy.AddJoin_management("Selectee_lyr", fld_SFID, outSelector, fld_SFID, "KEEP_COMMON")
-
-   # Select all Selectees that were joined
-   arcpy.SelectLayerByAttribute_management("Selectee_lyr", "NEW_SELECTION")
+   # Get the IDs of the Selectors
+   sfids = sorted({row[0] for row in arcpy.da.SearchCursor(outSelector, [fld_SFID]) if row[0] is not None})
+   if arcpy.ListFields(outSelector, fld_SFID)[0].type == "String":
+      sfids = ["'%s'" % str(i).replace("'", "''") for i in sfids]
+   else:
+      sfids = [str(i) for i in sfids]
 
-   # Remove the join
-   arcpy.RemoveJoin_management("Selectee_lyr")
+   # Select all Selectees associated with the Selectors, adding IDs in chunks to keep the queries a manageable size
+   for i in range(0, len(sfids), 1000):
+      qry = "%s IN (%s)" % (fld_SFID, ",".join(sfids[i:i+1000]))
+      arcpy.SelectLayerByAttribute_management("Selectee_lyr", "ADD_TO_SELECTION", qry)
+   
+   # An empty selection would copy everything, so if nothing was selected, restrict the layer itself to nothing
+   if countSelectedFeatures("Selectee_lyr") == 0:
+      arcpy.MakeFeatureLayer_management(inSelectee, "Selectee_lyr", "1 = 0")
 
    # Copy the selected Selectee features to the output feature class
    arcpy.CopyFeatures_management("Selectee_lyr", outSelectee)
@@ -947,7 +961,7 @@ def AddCoreAreaToSBBs(in_PF, in_SBB, fld_SFID, in_Core, out_SBB, BuffDist = "100
    
    # Buffer SBBs 
    sbbBuff = scratchGDB + os.sep + "sbbBuff"
-   arcpy.Buffer_analysis(sbbSub, sbbBuff, BuffDist, "FULL", "ROUND", "NONE", "", "PLANAR")
+   arcpy.analysis.PairwiseBuffer(sbbSub, sbbBuff, BuffDist, "NONE", "", "PLANAR")
    
    # Clip buffers to core
    clpBuff = scratchGDB + os.sep + "clpBuff"
@@ -1068,15 +1082,10 @@ def PrepProcFeats(in_PF, fld_Rule, fld_Buff, tmpWorkspace):
       tmp_PF = tmpWorkspace + os.sep + 'tmp_PF'
       arcpy.CopyFeatures_management(in_PF, tmp_PF)
 
-      # Process: Add Field (fltBuffer)
-      arcpy.AddField_management(tmp_PF, "fltBuffer", "FLOAT", "", "", "", "", "NULLABLE", "NON_REQUIRED", "")
-
-      # Process: Add Field (intRule)
-      arcpy.AddField_management(tmp_PF, "intRule", "SHORT", "", "", "", "", "NULLABLE", "NON_REQUIRED", "")
+      # Process: Add Fields (fltBuffer, intRule)
+      arcpy.AddFields_management(tmp_PF, [["fltBuffer", "FLOAT"], ["intRule", "SHORT"]])
 
-      # Process: Calculate Field (intRule)
-      expression1 = "string2int(!" + fld_Rule + "!)"
-      codeblock1 = """def string2int(RuleString):
+      def string2int(RuleString):
          try:
             RuleInteger = int(RuleString)
          except:
@@ -1084,13 +1093,10 @@ def PrepProcFeats(in_PF, fld_Rule, fld_Buff, tmpWorkspace):
                RuleInteger = -1
             else:
                RuleInteger = 0
-         return RuleInteger"""
-      arcpy.CalculateField_management(tmp_PF, "intRule", expression1, "PYTHON", codeblock1)
+         return RuleInteger
 
-      # Process: Calculate Field (fltBuffer)
       # Note that code here will have to change if changes are made to buffer standards
-      expression2 = "string2float(!intRule!, !%s!)"%fld_Buff
-      codeblock2 = """def string2float(RuleInteger, origBuff):
+      def string2float(RuleInteger, origBuff):
          if RuleInteger == -1:
             if not origBuff:
                BufferFloat = 0
@@ -1126,8 +1132,14 @@ def PrepProcFeats(in_PF, fld_Rule, fld_Buff, tmpWorkspace):
             BufferFloat = 0 
             # If zero buffer was entered, whether string or numeric, it overrides anything else
 
-         return BufferFloat"""
-      arcpy.CalculateField_management(tmp_PF, "fltBuffer", expression2, "PYTHON", codeblock2)
+         return BufferFloat
+
+      # Process: Calculate intRule and fltBuffer together, in a single pass
+      with arcpy.da.UpdateCursor(tmp_PF, [fld_Rule, fld_Buff, "intRule", "fltBuffer"]) as cursor:
+         for row in cursor:
+            row[2] = string2int(row[0])
+            row[3] = string2float(row[2], row[1])
+            cursor.updateRow(row)
 
       return tmp_PF
    except:
@@ -1148,6 +1160,8 @@ def CreateWetlandSBB(in_PF, fld_SFID, in_NWI, out_SBB, scratchGDB = "in_memory")
 #     7.  Clip the merged feature to the maximum buffer.'''
 
    # Prepare data
+   # The NWI is queried once per PF, so make sure it has a spatial index to work from
+   ensureSpatialIndex(in_NWI, warn = False)
    arcpy.management.MakeFeatureLayer(in_NWI, "NWI_lyr")
    tmp_PF = in_PF
    
@@ -1159,8 +1173,18 @@ def CreateWetlandSBB(in_PF, fld_SFID, in_NWI, out_SBB, scratchGDB = "in_memory")
    searchDist = "15 METERS" # search distance for inclusion of NWI features
    
    # Set workspace and some additional variables
+   # The per-feature intermediates are small and short-lived, so use the faster "memory" workspace in place of "in_memory"
+   if scratchGDB == "in_memory":
+      scratchGDB = "memory"
    arcpy.env.workspace = scratchGDB
    num, units, newMeas = multiMeasure(searchDist, 0.5)
+   # Distances as numbers, for geometry methods. These work in the linear units of the PF spatial reference, so convert from meters.
+   sr = arcpy.da.Describe(tmp_PF)["spatialReference"]
+   if sr.type != "Projected":
+      arcpy.AddError("The input features must be in a projected coordinate system, so that buffer and search distances can be applied to their geometries")
+      raise arcpy.ExecuteError
+   searchNum = multiMeasure(searchDist, 1)[0] / sr.metersPerUnit
+   nwiNum = multiMeasure(nwiBuff, 1)[0] / sr.metersPerUnit
 
    # Create an empty list to store IDs of features that fail to get processed
    myFailList = []
@@ -1171,81 +1195,95 @@ def CreateWetlandSBB(in_PF, fld_SFID, in_NWI, out_SBB, scratchGDB = "in_memory")
    # Count records and proceed accordingly
    count = countFeatures(tmp_PF)
    if count > 0:
+      # Steps 1 and 2: Create the minimum and maximum buffers for all Procedural Features at once, keyed by ObjectID
+      # For the "buffer override" specification, the PF itself is used as the minimum buffer, and the maximum buffer is reduced
+      printMsg("Creating minimum and maximum buffers...")
+      arcpy.management.AddFields(tmp_PF, [["pfOID", "LONG"], ["minDist", "TEXT", "", 50], ["maxDist", "TEXT", "", 50]])
+      try:
+         with arcpy.da.UpdateCursor(tmp_PF, ["OID@", "fltBuffer", "pfOID", "minDist", "maxDist"]) as cursor:
+            for row in cursor:
+               if row[1] == 0:
+                  cursor.updateRow([row[0], row[1], row[0], "0 METERS", minBuff])
+               else:
+                  cursor.updateRow([row[0], row[1], row[0], minBuff, maxBuff])
+         arcpy.analysis.PairwiseBuffer(tmp_PF, "allMinBuffer", "minDist")
+         arcpy.analysis.PairwiseBuffer(tmp_PF, "allMaxBuffer", "maxDist")
+         minBuffers = {row[0]: row[1] for row in arcpy.da.SearchCursor("allMinBuffer", ["pfOID", "SHAPE@"])}
+         maxBuffers = {row[0]: row[1] for row in arcpy.da.SearchCursor("allMaxBuffer", ["pfOID", "SHAPE@"])}
+      finally:
+         # The PFs are shared by all wetland rules, so the temporary fields must not be left behind for the next rule
+         arcpy.management.DeleteField(tmp_PF, ["pfOID", "minDist", "maxDist"])
+         garbagePickup(["allMinBuffer", "allMaxBuffer"])
+      
+      # Identify up front the PFs that have any NWI features within the maximum buffer distance
+      # The rest can skip the NWI steps and go straight to the default shape
+      printMsg("Identifying PFs with NWI features in range...")
+      arcpy.analysis.SpatialJoin(tmp_PF, "NWI_lyr", "pfNWI", "JOIN_ONE_TO_ONE", "KEEP_COMMON", "", "WITHIN_A_DISTANCE", maxBuff)
+      nwiPFs = {row[0] for row in arcpy.da.SearchCursor("pfNWI", ["TARGET_FID"])}
+      garbagePickup(["pfNWI"])
+      
       # Loop through the individual Procedural Features
       myIndex = 1 # Set a counter index
-      with arcpy.da.UpdateCursor(tmp_PF, [fld_SFID, "SHAPE@", "fltBuffer"]) as myProcFeats:
+      with arcpy.da.UpdateCursor(tmp_PF, [fld_SFID, "SHAPE@", "OID@"]) as myProcFeats:
          for myPF in myProcFeats:
          # for each Procedural Feature in the set, do the following...
          
             try: # Even if one feature fails, script can proceed to next feature
 
-               # Extract the unique Source Feature ID, geometry object, and buffer specification
+               # Extract the unique Source Feature ID, geometry object, and buffers
                myID = myPF[0]
                myShape = myPF[1]
-               myBuff = myPF[2]
+               myMinBuffer = minBuffers[myPF[2]]
+               myMaxBuffer = maxBuffers[myPF[2]]
 
                # Add a progress message
                printMsg("Working on feature %s, with SFID = %s" %(str(myIndex), myID))
 
-               # Step 1: Create a minimum buffer around the Procedural Feature [or not if zero override]
-               if myBuff==0:
-                  # This is the "buffer override" specification
-                  # printMsg("Using Procedural Feature as minimum buffer, and reducing maximum buffer")
-                  buff1 = 0
-                  buff2 = minBuff
-               else:
-                  # This is the standard specification
-                  # printMsg("Creating minimum buffer")
-                  buff1 = minBuff
-                  buff2 = maxBuff
-                  
-               arcpy.analysis.PairwiseBuffer (myShape, "myMinBuffer", buff1)
-                  
                # Get default shape to use if NWI doesn't come into play
-               defaultShape = arcpy.SearchCursor("myMinBuffer").next().Shape
-
-               # Step 2: Create a maximum buffer around the Procedural Feature
-               arcpy.analysis.PairwiseBuffer (myShape, "myMaxBuffer", buff2)
-               arcpy.env.extent = "myMaxBuffer"
+               defaultShape = myMinBuffer
                
                # Step 3: Clip the NWI to the maximum buffer
                # First check if there are any NWI features in range to work with
-               arcpy.management.SelectLayerByLocation("NWI_lyr", "INTERSECT", "myMaxBuffer")
-               c = countSelectedFeatures("NWI_lyr")
+               # The selection tool reports its own count of selected records, so there is no need to Describe the layer for it
+               if myPF[2] in nwiPFs:
+                  c = int(arcpy.management.SelectLayerByLocation("NWI_lyr", "INTERSECT", myMaxBuffer).getOutput(2))
+               else:
+                  c = 0
                
                if c > 0:
                   # printMsg("Clipping NWI features to maximum buffer...")
-                  arcpy.analysis.PairwiseClip("NWI_lyr", "myMaxBuffer", "clipNWI")
-                  arcpy.management.MakeFeatureLayer("clipNWI", "clipNWI_lyr")
+                  # The NWI shapes in range are few, so clip, select, buffer and combine them in memory as geometries
+                  clipNWI = [row[0].intersect(myMaxBuffer, 4) for row in arcpy.da.SearchCursor("NWI_lyr", ["SHAPE@"])]
+                  clipNWI = [g for g in clipNWI if g.area > 0]
 
                   # Step 4: Select clipped NWI features within range
                   # printMsg("Selecting nearby NWI features...")
-                  arcpy.management.SelectLayerByLocation("clipNWI_lyr", "WITHIN_A_DISTANCE", myShape, searchDist, "NEW_SELECTION")
+                  inRange = [g.distanceTo(myShape) <= searchNum for g in clipNWI]
+                  selNWI = [g for g, r in zip(clipNWI, inRange) if r]
 
                   # If NWI features are in range, then process
-                  c = countSelectedFeatures("clipNWI_lyr")
-                  if c > 0:
-                     # Iteratively expand the selection
-                     ExpandSelection("clipNWI_lyr", searchDist)
+                  if len(selNWI) > 0:
+                     # Iteratively expand the selection, adding features within range of those added in the previous pass
+                     frontier = selNWI
+                     others = [g for g, r in zip(clipNWI, inRange) if not r]
+                     while frontier and others:
+                        near = [any(g.distanceTo(f) <= searchNum for f in frontier) for g in others]
+                        frontier = [g for g, n in zip(others, near) if n]
+                        others = [g for g, n in zip(others, near) if not n]
+                        selNWI = selNWI + frontier
                      
                      # Step 5: Create a buffer around the NWI feature(s)
                      # printMsg("Buffering selected NWI features...")
-                     arcpy.analysis.PairwiseBuffer("clipNWI_lyr", "nwiBuff", nwiBuff)
-
-                     # Step 6: Merge the minimum buffer with the NWI buffer
-                     feats2merge = ["myMinBuffer", "nwiBuff"]
-                     arcpy.management.Merge(feats2merge, "tmpMerged")
-
-                     # Dissolve features into a single polygon
+                     # Step 6: Merge the minimum buffer with the NWI buffer, into a single polygon
                      # printMsg("Dissolving buffered PF and NWI features into a single feature...")
-                     arcpy.PairwiseDissolve_analysis("tmpMerged", "tmpDissolved")
+                     tmpShape = myMinBuffer
+                     for g in selNWI:
+                        tmpShape = tmpShape.union(g.buffer(nwiNum))
 
                      # Step 7: Clip the dissolved feature to the maximum buffer
                      # printMsg("Clipping dissolved feature to maximum buffer...")
-                     arcpy.analysis.PairwiseClip("tmpDissolved", "myMaxBuffer", "tmpClip")
-
                      # Use the clipped, combined feature geometry as the final shape
-                     myFinalShape = arcpy.SearchCursor("tmpClip").next().Shape
+                     myFinalShape = tmpShape.intersect(myMaxBuffer, 4)
                   else:
                      # printMsg("No appropriate NWI features in range...")
                      myFinalShape = defaultShape
@@ -1265,10 +1303,8 @@ def CreateWetlandSBB(in_PF, fld_SFID, in_NWI, out_SBB, scratchGDB = "in_memory")
                printMsg("\nFailed to fully process feature " + str(myIndex))
                myFailList.append(int(myID))
 
-               # Error handling code swiped from "A Python Primer for ArcGIS"
-               tb = sys.exc_info()[2]
-               tbinfo = traceback.format_tb(tb)[0]
-               pymsg = "PYTHON ERRORS:\nTraceback Info:\n" + tbinfo + "\nError Info:\n " + str(sys.exc_info()[1])
+               # Error handling code adapted from "A Python Primer for ArcGIS"
+               pymsg = "PYTHON ERRORS:\n" + traceback.format_exc()
                msgs = "ARCPY ERRORS:\n" + arcpy.GetMessages(2) + "\n"
 
                printWrng(msgs)
@@ -1279,13 +1315,8 @@ def CreateWetlandSBB(in_PF, fld_SFID, in_NWI, out_SBB, scratchGDB = "in_memory")
                printMsg("\nMoving on to the next feature.  Note that the SBB output will be incomplete.")
 
             finally:
-               arcpy.env.extent = "MAXOF"
-               
                # Increment the index by one
                myIndex += 1
-               
-               # Release cursor row
-               del myPF
 
       # Once the script as a whole has succeeded, let the user know if any individual features failed
       if len(myFailList) == 0:
@@ -1317,13 +1348,19 @@ def CreateSBBs(in_PF, fld_SFID, fld_Rule, fld_Buff, in_nwi = "NA", out_SBB = "sb
    getScratchMsg(scratchGDB)
 
    # Set up some variables
-   sr = arcpy.Describe(in_PF).spatialReference
+   sr = arcpy.da.Describe(in_PF)["spatialReference"]
    arcpy.env.workspace = scratchGDB
    sbbWarnings = []
+   nwiGenTol = "1 Meters" # Tolerance used to generalize NWI features before processing. This can be tweaked if desired; a larger value speeds processing at the cost of shape fidelity.
 
    # Prepare input procedural featuers
    printMsg("Prepping input procedural features")
    tmp_PF = PrepProcFeats(in_PF, fld_Rule, fld_Buff, scratchGDB)
+   
+   # Index the fields used to subset the PFs by rule. Memory workspaces do not support attribute indexes.
+   if scratchGDB not in ("in_memory", "memory"):
+      arcpy.management.AddIndex(tmp_PF, ["intRule", "fltBuffer"], "idx_RuleBuff")
+      arcpy.management.AddIndex(tmp_PF, fld_SFID, "idx_SFID")
 
    printMsg("Beginning SBB creation...")
 
@@ -1336,63 +1373,70 @@ def CreateSBBs(in_PF, fld_SFID, fld_Rule, fld_Buff, in_nwi = "NA", out_SBB = "sb
    printMsg("Creating %s in %s" %(outName, outDir))
    arcpy.CreateFeatureclass_management(outDir, outName, "POLYGON", tmp_PF, '', '', sr)
 
-   # Create simple buffer SBBs
-   selQry = "intRule in (-1,1,2,3,4,8,10,11,12,13,14) AND fltBuffer <> 0"
-   arcpy.management.MakeFeatureLayer(tmp_PF, "tmpLyr", selQry)
-   c = countFeatures("tmpLyr")
+   # Create simple buffer and no-buffer SBBs in a single pass
+   # A zero buffer distance returns the PF itself, so the no-buffer features are handled by the same buffer call.
+   selQry = "intRule in (-1,1,2,3,4,8,10,11,12,13,14,15) AND fltBuffer IS NOT NULL"
+   # A single layer is used for all subsets, switching between them by selection
+   arcpy.management.MakeFeatureLayer(tmp_PF, "tmpLyr")
+   arcpy.management.SelectLayerByAttribute("tmpLyr", "NEW_SELECTION", selQry)
+   c = countSelectedFeatures("tmpLyr")
    if c > 0:
-      printMsg("Processing the simple defined-buffer features...")
+      printMsg("Processing the simple defined-buffer and no-buffer features...")
       try:
          # Run simple buffer
          arcpy.analysis.PairwiseBuffer("tmpLyr", "tmpSBB", "fltBuffer", "NONE")
          
          # Append to SBB feature class and cleanup
          arcpy.management.Append ("tmpSBB", out_SBB, "NO_TEST")
-         printMsg("Simple buffer SBBs completed successfully.")
+         printMsg("Simple buffer and no-buffer SBBs completed successfully.")
          garbagePickup(["tmpSBB"])
       except:
-         printWrng("Unable to process the simple buffer features")
+         printWrng("Unable to process the simple buffer and no-buffer features")
          tback()
-         msg = "WARNING: There was a problem creating the simple buffer SBBS."
+         msg = "WARNING: There was a problem creating the simple buffer and no-buffer SBBS."
          sbbWarnings.append(msg)
    else:
-      printMsg("There are no PFs using the simple buffer rules. Passing...")
+      printMsg("There are no PFs using the simple buffer or no-buffer rules. Passing...")
+
+   #Create wetland SBBs
+   rules = [5, 6, 7, 9]
    
-   # Create no-buffer SBBs
-   selQry = "(intRule in (-1,1,2,3,4,8,10,11,12,13,14,15) AND (fltBuffer = 0))"
-   arcpy.management.MakeFeatureLayer(tmp_PF, "tmpLyr", selQry)
-   c = countFeatures("tmpLyr")
-   if c > 0:
-      printMsg("Processing the no-buffer features...")
+   # Create a subset of NWI features within the maximum buffer distance of any wetland PF, shared by all wetland rules. This helps speed processing in the CreateWetlandSBB function.
+   # Make sure that search_distance is the same as the maxBuff in that function (currently 500-m).
+   arcpy.management.SelectLayerByAttribute("tmpLyr", "NEW_SELECTION", "intRule in (%s)" % ",".join([str(r) for r in rules]))
+   nwiRules = dict()
+   if countSelectedFeatures("tmpLyr") > 0:
+      printMsg("Subsetting NWI features near wetland PFs...")
       try:
-         # Use PFs as SBBs
-         arcpy.management.Append ("tmpLyr", out_SBB, "NO_TEST")
-         printMsg('No-buffer SBBs completed')
+         nwiQry = " OR ".join(["Rule%s = 1" % r for r in rules])
+         nwi = arcpy.management.MakeFeatureLayer(in_nwi, "tmpNWI", nwiQry)
+         arcpy.SelectLayerByLocation_management(nwi, "WITHIN_A_DISTANCE", "tmpLyr", search_distance="500 Meters")
+         nwiSub = scratchGDB + os.sep + "nwiSub"
+         arcpy.CopyFeatures_management(nwi, nwiSub)
+         # Cull extra vertices from the NWI subset, to speed up the buffer and clip operations that follow
+         arcpy.Generalize_edit(nwiSub, nwiGenTol)
+         
+         # Split the NWI subset into rule-specific feature classes up front, so each rule works from a smaller candidate set
+         for r in rules:
+            nwiRules[r] = scratchGDB + os.sep + "nwiSub%s" % r
+            arcpy.analysis.Select(nwiSub, nwiRules[r], "Rule%s = 1" % r)
       except:
-         printWrng('Unable to process the no-buffer features.')
+         printWrng("Unable to subset the NWI features")
          tback()
-         msg = "WARNING: There was a problem creating the no-buffer SBBS."
+         msg = "WARNING: There was a problem subsetting the NWI features, so the wetland rule (5, 6, 7, 9) SBBs were not created."
          sbbWarnings.append(msg)
-   else:
-      printMsg('There are no PFs using the no-buffer rules. Passing...')
-
-   #Create wetland SBBs
-   rules = [5, 6, 7, 9]
+         nwiRules = None
+   
    for r in rules:
       selQry = "intRule = %s"%r
-      arcpy.management.MakeFeatureLayer(tmp_PF, "tmpLyr", selQry)
-      c = countFeatures("tmpLyr")
-      if c > 0:
+      arcpy.management.SelectLayerByAttribute("tmpLyr", "NEW_SELECTION", selQry)
+      c = countSelectedFeatures("tmpLyr")
+      if c > 0 and nwiRules is None:
+         printMsg("No NWI subset is available for the Rule %s features. Passing..."%r)
+      elif c > 0:
          printMsg("Processing the Rule %s features"%r)
          try:
-            nwiQry = "Rule%s = 1"%r
-            nwi = arcpy.management.MakeFeatureLayer(in_nwi, "tmpNWI", nwiQry)
-            # Create a subset of NWI features within the maximum buffer distance. This helps speed processing in the CreateWetlandSBB function.
-            # Make sure that search_distance is the same as the maxBuff in that function (currently 500-m).
-            arcpy.SelectLayerByLocation_management(nwi, "WITHIN_A_DISTANCE", "tmpLyr", search_distance="500 Meters")
-            nwiSub = scratchGDB + os.sep + "nwiSub"
-            arcpy.CopyFeatures_management(nwi, nwiSub)
-            msg = CreateWetlandSBB("tmpLyr", fld_SFID, nwiSub, out_SBB, scratchGDB)
+            msg = CreateWetlandSBB("tmpLyr", fld_SFID, nwiRules[r], out_SBB, scratchGDB)
             warnMsgs = arcpy.GetMessages(1)
             if warnMsgs:
                printWrng("Finished processing Rule %s, but there were some problems."%r)
@@ -1434,6 +1478,9 @@ def ExpandSBBs(in_Cores, in_SBB, in_PF, fld_SFID, out_SBB, scratchGDB = "in_memo
    # Print helpful message to geoprocessing window
    getScratchMsg(scratchGDB)
    
+   # Let the pairwise tools use all available cores
+   arcpy.env.parallelProcessingFactor = "100%"
+   
    # Set up output locations for subsets of SBBs and PFs to process
    SBB_sub = scratchGDB + os.sep + 'SBB_sub'
    PF_sub = scratchGDB + os.sep + 'PF_sub'
@@ -1456,25 +1503,56 @@ def ExpandSBBs(in_Cores, in_SBB, in_PF, fld_SFID, out_SBB, scratchGDB = "in_memo
    numCores = countFeatures(selCores)
    printMsg('There are %s cores to process.' %str(numCores))
    
-   # Create Feature Class to store expanded SBBs
-   arcpy.CreateFeatureclass_management(scratchGDB, 'sbbExpand', "POLYGON", SBB_sub, "", "", SBB_sub) 
-   sbbExpand = scratchGDB + os.sep + 'sbbExpand'
+   # Pair each PF (other than AHZ and Rule 1) with the cores it intersects, in a single spatial join
+   printMsg('Pairing PFs with cores...')
+   arcpy.MakeFeatureLayer_management(PF_sub, "PF_CoreSub", "RULE NOT IN ('AHZ', '1')")
+   pfCore = scratchGDB + os.sep + 'pfCore'
+   arcpy.analysis.SpatialJoin("PF_CoreSub", selCores, pfCore, "JOIN_ONE_TO_MANY", "KEEP_COMMON", "", "INTERSECT")
+   pairs = dict()
+   sfidPairs = dict()
+   corePFs = dict()
+   with arcpy.da.SearchCursor(pfCore, [fld_SFID, "CoreID", "SHAPE@"]) as cursor:
+      for sfid, coreID, pfShp in cursor:
+         if (sfid, coreID) not in pairs:
+            pairs[(sfid, coreID)] = len(pairs)
+            sfidPairs.setdefault(sfid, []).append(pairs[(sfid, coreID)])
+         corePFs.setdefault(coreID, []).append(pfShp)
+   
+   # Add core area to SBBs of PFs intersecting cores, for all cores at once.
+   # Extra buffer is added to the SBBs, and snipped to each core their PFs intersect.
+   printMsg('Buffering SBBs and snipping to cores...')
+   arcpy.SelectLayerByLocation_management("PF_CoreSub", "INTERSECT", selCores, "", "NEW_SELECTION", "NOT_INVERT")
+   sbbSub = scratchGDB + os.sep + 'sbb'
+   pfSub = scratchGDB + os.sep + 'pf'
+   SubsetSBBandPF(SBB_sub, "PF_CoreSub", "SBB", fld_SFID, sbbSub, pfSub)
+   sbbBuff = scratchGDB + os.sep + "sbbBuff"
+   arcpy.analysis.PairwiseBuffer(sbbSub, sbbBuff, "1000 METERS")
+   sbbCore = scratchGDB + os.sep + "sbbCore"
+   arcpy.analysis.PairwiseIntersect([sbbBuff, selCores], sbbCore)
+   clpBuff = scratchGDB + os.sep + "clpBuff"
+   CleanFeatures(sbbCore, clpBuff)
    
-   # Loop through Cores and add core buffers to SBBs
-   counter = 1
-   with arcpy.da.SearchCursor(selCores, ["SHAPE@", "CoreID"]) as myCores:
-      for core in myCores:
-         # Add extra buffer for SBBs of PFs located in cores. Extra buffer needs to be snipped to core in question.
-         coreShp = core[0]
-         coreID = core[1]
-         printMsg('Working on Core ID %s' % str(coreID))
-         tmpSBB = scratchGDB + os.sep + 'sbb'
-         AddCoreAreaToSBBs(PF_sub, SBB_sub, fld_SFID, coreShp, tmpSBB, "1000 METERS", scratchGDB)
-         
-         # Append expanded SBB features to output
-         arcpy.Append_management(tmpSBB, sbbExpand, "NO_TEST")
-         
-         del core
+   # Gather each SBB with its fragments for each core, keyed by PF/core pair
+   # Fragments not containing a PF in the core are removed
+   sbbMerge = scratchGDB + os.sep + "sbbMerge"
+   arcpy.CreateFeatureclass_management(scratchGDB, 'sbbMerge', "POLYGON", SBB_sub, "", "", SBB_sub)
+   arcpy.AddField_management(sbbMerge, "pairID", "LONG")
+   with arcpy.da.InsertCursor(sbbMerge, [fld_SFID, "intRule", "pairID", "SHAPE@"]) as insCursor:
+      with arcpy.da.SearchCursor(sbbSub, [fld_SFID, "intRule", "SHAPE@"]) as cursor:
+         for sfid, rule, sbbShp in cursor:
+            for pairID in sfidPairs.get(sfid, []):
+               insCursor.insertRow([sfid, rule, pairID, sbbShp])
+      with arcpy.da.SearchCursor(clpBuff, [fld_SFID, "intRule", "CoreID", "SHAPE@"]) as cursor:
+         for sfid, rule, coreID, fragShp in cursor:
+            pairID = pairs.get((sfid, coreID))
+            if pairID is None:
+               continue
+            if any(not fragShp.disjoint(pfShp) for pfShp in corePFs[coreID]):
+               insCursor.insertRow([sfid, rule, pairID, fragShp])
+   
+   # Dissolve to get final shapes, one per SBB and core
+   sbbExpand = scratchGDB + os.sep + 'sbbExpand'
+   arcpy.PairwiseDissolve_analysis(sbbMerge, sbbExpand, [fld_SFID, "intRule", "pairID"])
    
    printMsg("Merging all SBBs and smoothing to get final shapes...")
    sbbAll = scratchGDB + os.sep + "sbbAll"
@@ -1541,6 +1619,9 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
 
    # Set overwrite option so that existing data may be overwritten
    arcpy.env.overwriteOutput = True 
+   
+   # Let the pairwise tools use all available cores
+   arcpy.env.parallelProcessingFactor = "100%"
 
    # Declare path/name of output data and workspace
    drive, path = os.path.splitdrive(out_ConSites) 
@@ -1617,6 +1698,10 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
    printMsg('Finished ProtoSite creation. There are %s ProtoSites.' %numPS)
    printMsg('Elapsed time: %s' %deltaString)
 
+   # Create the feature class to store split sites once; it is emptied for each ProtoSite
+   tmpSS_grp = scratchGDB + os.sep + "tmpSS_grp"
+   arcpy.management.CreateFeatureclass(scratchGDB, "tmpSS_grp", "POLYGON", in_ConSites, "", "", in_ConSites)
+   
    # Loop through the ProtoSites to create final ConSites
    printMsg("Modifying individual ProtoSites to create final Conservation Sites...")
    counter = 1
@@ -1627,8 +1712,7 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
             tProtoStart = datetime.now()
             
             tmpPS = myPS[0]
-            tmpSS_grp = scratchGDB + os.sep + "tmpSS_grp"
-            arcpy.management.CreateFeatureclass(scratchGDB, "tmpSS_grp", "POLYGON", in_ConSites, "", "", in_ConSites)
+            arcpy.management.TruncateTable(tmpSS_grp)
             
             # Buffer around the ProtoSite and set extent
             tmpBuff = scratchGDB + os.sep + 'tmpBuff'
@@ -1677,17 +1761,21 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
             hydroClp = scratchGDB + os.sep + 'hydroClp'
             CleanClip(water, tmpBuff, hydroClp, scratchParm)
             
-            # Dissolve Hydro Erase Features
-            hydroDiss = scratchGDB + os.sep + 'hydroDiss'
-            arcpy.PairwiseDissolve_analysis(hydroClp, hydroDiss, "Hydro", multi_part="SINGLE_PART")
-            
-            # Cull Hydro Erase Features
-            hydroRtn = scratchGDB + os.sep + 'hydroRtn'
-            CullEraseFeats(hydroDiss, tmpSBB, hydroPerCov, hydroRtn, scratchParm)
-            
-            # Remove narrow hydro from erase features; also punch out PFs
-            hydroErase = scratchGDB + os.sep + 'hydroErase'
-            GetEraseFeats (hydroRtn, hydroQry, hydroElimDist, hydroErase, tmpPF, scratchParm)
+            if not hasFeatures(hydroClp):
+               # No hydro features to process, so the (empty) clip serves as the hydro erase features
+               hydroErase = hydroClp
+            else:
+               # Dissolve Hydro Erase Features
+               hydroDiss = scratchGDB + os.sep + 'hydroDiss'
+               arcpy.PairwiseDissolve_analysis(hydroClp, hydroDiss, "Hydro", multi_part="SINGLE_PART")
+               
+               # Cull Hydro Erase Features
+               hydroRtn = scratchGDB + os.sep + 'hydroRtn'
+               CullEraseFeats(hydroDiss, tmpSBB, hydroPerCov, hydroRtn, scratchParm)
+               
+               # Remove narrow hydro from erase features; also punch out PFs
+               hydroErase = scratchGDB + os.sep + 'hydroErase'
+               GetEraseFeats (hydroRtn, hydroQry, hydroElimDist, hydroErase, tmpPF, scratchParm)
             
             # Merge Erase Features (Exclusions, hydro, and transportation)
             if site_Type == 'TERRESTRIAL':
@@ -1708,6 +1796,8 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
             sbbClusters = scratchGDB + os.sep + 'sbbClusters'
             sbbErase = scratchGDB + os.sep + 'sbbErase'
             ChopMod(tmpPF, tmpSBB, "SFID", coalErase, sbbClusters, sbbErase, siteSearchDist, siteSmthDist, scratchParm)
+            # The clusters are used to clip the PFs and are then selected by location for every split site
+            ensureSpatialIndex(sbbClusters, warn = False)
             arcpy.management.MakeFeatureLayer(sbbClusters, "sbbClust") 
             
             # Stitch sbb clusters together and modify erase features some more? NOPE.
@@ -1721,7 +1811,14 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
             
             printMsg('Clipping PFs to chopped SBB clusters... yeah this is kinda radical!')
             pfRtn = scratchGDB + os.sep + 'pfRtn'
-            arcpy.analysis.PairwiseClip(tmpPF, sbbClusters, pfRtn)
+            # The clusters usually contain the PFs outright, in which case the clip would return them unchanged
+            arcpy.management.MakeFeatureLayer(tmpPF, "pfClip_lyr")
+            numCross = int(arcpy.management.SelectLayerByLocation("pfClip_lyr", "COMPLETELY_WITHIN", sbbClusters, "", "NEW_SELECTION", "INVERT").getOutput(2))
+            arcpy.management.Delete("pfClip_lyr")
+            if numCross == 0:
+               arcpy.management.CopyFeatures(tmpPF, pfRtn)
+            else:
+               arcpy.analysis.PairwiseClip(tmpPF, sbbClusters, pfRtn)
             # # Need to make a new feature layer, also
             pf2 = arcpy.management.MakeFeatureLayer(pfRtn, "PF_lyr2")
             
@@ -1744,46 +1841,50 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
                continue
             # Loop through the retained ProtoSite fragments (aka "Split Sites")
             counter2 = 1
-            with arcpy.da.SearchCursor(psRtn, ["SHAPE@"]) as mySplitSites:
-               for mySS in mySplitSites:
-                  printMsg('Working on ProtoSite fragment %s' % str(counter2))
-
-                  tmpSS = mySS[0]
+            # Read the split site shapes up front, so no cursor is held open while the geoprocessing tools run in the loop
+            mySplitSites = [row[0] for row in arcpy.da.SearchCursor(psRtn, ["SHAPE@"])]
+            for tmpSS in mySplitSites:
+               printMsg('Working on ProtoSite fragment %s' % str(counter2))
                   
-                  # Get SBB clusters within split site
-                  arcpy.management.SelectLayerByLocation("sbbClust", "INTERSECT", tmpSS)
-                  # Get retained PFs within split site (used for culling)
-                  arcpy.management.SelectLayerByLocation(pf2, "INTERSECT", tmpSS)
+               # Get SBB clusters within split site
+               numClust = int(arcpy.management.SelectLayerByLocation("sbbClust", "INTERSECT", tmpSS).getOutput(2))
+               # Get retained PFs within split site (used for culling)
+               numPF = int(arcpy.management.SelectLayerByLocation(pf2, "INTERSECT", tmpSS).getOutput(2))
+               
+               # With an empty selection the tools below would run on all features, so skip the fragment instead
+               if numClust == 0 or numPF == 0:
+                  printMsg("No SBB clusters or PFs within ProtoSite fragment %s. Skipping..." % str(counter2))
+                  counter2 +=1
+                  continue
                   
-                  # Shrinkwrap SBB clusters
-                  # Don't even think about doing a simple coalesce here to save time! 
-                  # MUST shrinkwrap or you get bad results in some situations.
-                  printMsg('Shrinkwrap SBB fragments...')
-                  csShrink = scratchGDB + os.sep + 'csShrink' + str(counter2)
-                  ShrinkWrap("sbbClust", clusterDist, csShrink, smthDist, scratchGDB)
+               # Shrinkwrap SBB clusters
+               # Don't even think about doing a simple coalesce here to save time! 
+               # MUST shrinkwrap or you get bad results in some situations.
+               printMsg('Shrinkwrap SBB fragments...')
+               csShrink = scratchGDB + os.sep + 'csShrink' + str(counter2)
+               ShrinkWrap("sbbClust", clusterDist, csShrink, smthDist, scratchGDB)
                   
-                  # Use erase features to chop out areas of sites
-                  printMsg('Erasing portions of sites...')
-                  siteFrags = scratchGDB + os.sep + 'siteFrags' + str(counter2)
-                  CleanErase(csShrink, finErase, siteFrags, scratchParm) 
+               # Use erase features to chop out areas of sites
+               printMsg('Erasing portions of sites...')
+               siteFrags = scratchGDB + os.sep + 'siteFrags' + str(counter2)
+               CleanErase(csShrink, finErase, siteFrags, scratchParm) 
                   
-                  # Cull site fragments
-                  printMsg('Culling site fragments...')
-                  ssBnd = scratchGDB + os.sep + 'ssBnd' + str(counter2)
-                  # CullFrags(siteFrags, pfRtn, searchDist, ssBnd)
-                  CullFrags(siteFrags, pf2, searchDist, ssBnd)
+               # Cull site fragments
+               printMsg('Culling site fragments...')
+               ssBnd = scratchGDB + os.sep + 'ssBnd' + str(counter2)
+               # CullFrags(siteFrags, pfRtn, searchDist, ssBnd)
+               CullFrags(siteFrags, pf2, searchDist, ssBnd)
                   
-                  # Final smoothing operation. Yes this is necessary!
-                  printMsg('Smoothing boundaries...')
-                  smoothBnd = scratchGDB + os.sep + "smooth%s"%str(counter2)
-                  Coalesce(ssBnd, siteSmthDist, smoothBnd, scratchParm)
-
-                  # Append the final geometry to the split sites group feature class.
-                  printMsg("Appending features...")
-                  arcpy.management.Append(smoothBnd, tmpSS_grp, "NO_TEST", "", "")
+               # Final smoothing operation. Yes this is necessary!
+               printMsg('Smoothing boundaries...')
+               smoothBnd = scratchGDB + os.sep + "smooth%s"%str(counter2)
+               Coalesce(ssBnd, siteSmthDist, smoothBnd, scratchParm)
+
+               # Append the final geometry to the split sites group feature class.
+               printMsg("Appending features...")
+               appendShapes(smoothBnd, tmpSS_grp)
                   
-                  counter2 +=1
-                  del mySS
+               counter2 +=1
             # NOTE: In rare cases, the above loop creates overlapping split sites. Overlapping split sites cause issues
             #  with the subsequent re-join procedure. This happens when the same sbbCluster polygons intersect more
             #  than one split site. Dissolve tmpSS_grp to single-part polygons in tmpSS_grp2
@@ -1809,8 +1910,7 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
                arcpy.management.Sort(intBuff, intBuffS, [["ss_length", "ASCENDING"]])
                arcpy.management.DeleteIdentical(intBuffS, ["Shape"])
 
-               c = countFeatures(intBuffS)
-               if c > 0:
+               if hasFeatures(intBuffS):
                   # intBuffS is multipart but that's okay, want full length of it
                   arcpy.management.CalculateGeometryAttributes(intBuffS, "LENGTH PERIMETER_LENGTH", "METERS")
                   # Calculation necessary b/c shape_length doesn't persist in_memory
@@ -1818,8 +1918,7 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
                   patchFrags = scratchGDB + os.sep + "patchFrags%s"%str(counter)
                   arcpy.analysis.Select(intBuffS, patchFrags, qry)
                   
-                  patches = countFeatures(patchFrags)
-                  if patches > 0:                     
+                  if hasFeatures(patchFrags):                     
                      # Clean to avoid processing errors
                      cleanFrags = scratchGDB + os.sep + "cleanFrags%s"%str(counter)
                      CleanFeatures(patchFrags, cleanFrags)
@@ -1833,13 +1932,13 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
                         # Make a smoother patch
                         buffFrags = scratchGDB + os.sep + "buffFrags%s"%str(counter)
                         patchDist2 = multiMeasure(patchDist, 1.02)[2]
-                        arcpy.analysis.Buffer("patch_lyr", buffFrags, patchDist2)
+                        arcpy.analysis.PairwiseBuffer("patch_lyr", buffFrags, patchDist2)
                         clipFrags = scratchGDB + os.sep + "clipFrags%s"%str(counter) 
-                        arcpy.analysis.Clip(buffFrags, tmpSS_grp2, clipFrags)
+                        arcpy.analysis.PairwiseClip(buffFrags, tmpSS_grp2, clipFrags)
                         chullPatch = scratchGDB + os.sep + "chullPatch%s" % str(counter)
                         arcpy.management.MinimumBoundingGeometry(clipFrags, chullPatch, "CONVEX_HULL")
                         finalPatch = scratchGDB + os.sep + "finalPatch%s" % str(counter)
-                        arcpy.analysis.Clip(buffFrags, chullPatch, finalPatch)
+                        arcpy.analysis.PairwiseClip(buffFrags, chullPatch, finalPatch)
                         # Merge and dissolve with adjacent split sites
                         mergeFrags = scratchGDB + os.sep + "mergeFrags%s"%str(counter)
                         arcpy.management.Merge([finalPatch, tmpSS_grp2], mergeFrags)
@@ -1870,18 +1969,11 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
             else:
                modBnd = smoothBnd
 
-            # Eliminate holes
-            printMsg("Eliminating holes...")
-            finBnd = scratchGDB + os.sep + "finBnd"
-            arcpy.management.EliminatePolygonPart(modBnd, finBnd, "PERCENT", "", 99.99, "CONTAINED_ONLY")
-            
-            # Generalize
-            printMsg('Generalizing boundary...')
-            arcpy.edit.Generalize(finBnd, "0.5 METERS")
-
-            # Append the final geometry to the ConSites feature class.
-            printMsg("Appending feature...")
-            arcpy.management.Append(finBnd, out_ConSites, "NO_TEST", "", "")
+            # Eliminate holes, generalize (0.5 meters), and append the final geometry to the ConSites feature class, in a single pass
+            printMsg("Eliminating holes, generalizing boundary, and appending feature...")
+            with arcpy.da.InsertCursor(out_ConSites, ["SHAPE@"]) as outCursor:
+               for row in arcpy.da.SearchCursor(modBnd, ["SHAPE@"]):
+                  outCursor.insertRow([fillHoles(row[0], 99.99).generalize(0.5)])
             
             printMsg("Processing complete for ProtoSite %s." %str(counter))
             
@@ -1916,7 +2008,7 @@ def CreateConSites(in_SBB, in_PF, fld_SFID, in_ConSites, out_ConSites, site_Type
    return out_ConSites
 
 ### Functions for creating Stream Conservation Sites (SCS) ###
-def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500):
+def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500, save_lyrx = True):
    """Creates four Network Analyst service layers needed for SCS delineation.
    This tool only needs to be run the first time you run the suite of SCS delineation tools. After that, the output
    layers can be reused repeatedly for the subsequent tools in the SCS delineation sequence.
@@ -1939,14 +2031,16 @@ def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500):
    - in_dams = Input dams (use National Inventory of Dams)
    - upDist = The distance (in map units) to traverse upstream from a point along the network
    - downDist = The distance (in map units) to traverse downstream from a point along the network
+   - save_lyrx = Whether to save the service layers to layer files. If True (default), the layer file paths are returned. If False, 
+      the layer objects are returned instead, for use by CreateLines_scs within the same session.
+   
+   Returns a tuple of the downstream, upstream, tidal, and filler service layers.
    """
    arcpy.CheckOutExtension("Network")
    
    # Set up some variables
-   descHydro = arcpy.Describe(in_hydroNet)
-   nwDataset = descHydro.catalogPath
-   catPath = os.path.dirname(nwDataset) # This is where hydro layers will be found
-   hydroDir = os.path.dirname(os.path.dirname(catPath)) # This is where output layer files will be saved
+   # catPath is where hydro layers will be found; hydroDir is where output layer files will be saved
+   nwDataset, catPath, hydroDir = getHydroPaths(in_hydroNet)
    downString = (str(downDist)).replace(".","_")
    upString = (str(upDist)).replace(".","_")
    lyrDownTrace = hydroDir + os.sep + "naDownTrace_%s.lyrx"%downString
@@ -1959,6 +2053,7 @@ def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500):
    lyr_dams = arcpy.MakeFeatureLayer_management(in_dams, where_clause="NH_IGNORE IS NULL OR NH_IGNORE = 0")
    
    printMsg("Creating upstream, downstream, tidal, and filler service layers...")
+   outLyrs = []
    for sl in [["naDownTrace", downDist, "SCS Downstream", lyrDownTrace],
               ["naUpTrace", upDist, "SCS Upstream", lyrUpTrace],
               ["naTidalTrace", upDist, "SCS All Directions", lyrTidalTrace],
@@ -1970,7 +2065,7 @@ def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500):
       outLyrx = sl[3]
       
       # Set up the analysis layer
-      arcpy.na.MakeServiceAreaAnalysisLayer(network_data_source = nwDataset, 
+      naLyr = arcpy.na.MakeServiceAreaAnalysisLayer(network_data_source = nwDataset, 
          layer_name = saLyr, 
          travel_mode = travMode, 
          travel_direction = "FROM_FACILITIES", 
@@ -1984,7 +2079,7 @@ def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500):
          polygon_trim_distance = "", 
          exclude_sources_from_polygon_generation = "", 
          accumulate_attributes = "Length", 
-         ignore_invalid_locations = "SKIP")
+         ignore_invalid_locations = "SKIP").getOutput(0)
       
       # Add dam barriers
       arcpy.na.AddLocations(in_network_analysis_layer = saLyr, 
@@ -2008,12 +2103,16 @@ def MakeServiceLayers_scs(in_hydroNet, in_dams, upDist = 3000, downDist = 500):
       arcpy.management.SelectLayerByAttribute(barriers, "NEW_SELECTION", "Status = 1", None)
       arcpy.management.DeleteFeatures(barriers)
       
-      printMsg("Saving service layer to %s..." %outLyrx)
-      arcpy.SaveToLayerFile_management(saLyr, outLyrx)
+      if save_lyrx:
+         printMsg("Saving service layer to %s..." %outLyrx)
+         arcpy.SaveToLayerFile_management(saLyr, outLyrx)
+         outLyrs.append(outLyrx)
+      else:
+         outLyrs.append(naLyr)
 
    arcpy.CheckInExtension("Network")
    
-   return (lyrDownTrace, lyrUpTrace, lyrTidalTrace)
+   return tuple(outLyrs)
 
 def MakeNetworkPts_scs(in_PF, in_hydroNet, in_Catch, in_NWI, out_Points, fld_SFID = "SFID", fld_Tidal = "Tidal", out_Scratch = "in_memory"):
    """Given a set of procedural features, creates points along the hydrological network. The user must ensure that the procedural features are "SCS-worthy."
@@ -2055,15 +2154,19 @@ def MakeNetworkPts_scs(in_PF, in_hydroNet, in_Catch, in_NWI, out_Points, fld_SFI
    lyrNWI = arcpy.MakeFeatureLayer_management(in_NWI, where_clause=fld_Tidal + " = 1")
    lyrPts = arcpy.MakeFeatureLayer_management(out_Points)
    arcpy.SelectLayerByLocation_management(lyrPts, "INTERSECT", lyrNWI)
-   c = countSelectedFeatures(lyrPts)
-   if c == 0:
+   tidalIDs = set(getSelectedOIDs(lyrPts))
+   if len(tidalIDs) == 0:
       printMsg("No points intersect tidal wetlands.")
-   else:
-      arcpy.CalculateField_management(lyrPts, fld_Tidal, 1, field_type="SHORT")
-   arcpy.SelectLayerByAttribute_management(lyrPts, "SWITCH_SELECTION")
-   arcpy.CalculateField_management(lyrPts, fld_Tidal, 0, field_type="SHORT")
    del lyrPts, lyrNWI
    
+   # Code the tidal (1) and non-tidal (0) points in a single pass
+   if fld_Tidal not in GetFlds(out_Points):
+      arcpy.management.AddField(out_Points, fld_Tidal, "SHORT")
+   with arcpy.da.UpdateCursor(out_Points, ["OID@", fld_Tidal]) as cursor:
+      for row in cursor:
+         row[1] = 1 if row[0] in tidalIDs else 0
+         cursor.updateRow(row)
+   
    # timestamp
    t1 = datetime.now()
    ds = GetElapsedTime (t0, t1)
@@ -2072,6 +2175,20 @@ def MakeNetworkPts_scs(in_PF, in_hydroNet, in_Catch, in_NWI, out_Points, fld_SFI
    printMsg("Network point generation complete.")
    return out_Points
 
+def getServiceLines_scs(naLyr):
+   """Returns the Lines sublayer of a Network Analyst service area layer. The service layer may be given as a layer file path, 
+   the name of a map layer, or a layer object (as returned by MakeServiceLayers_scs when save_lyrx is False)."""
+   if not isinstance(naLyr, str):
+      # This is used when the layer object is passed to the function
+      return naLyr.listLayers(arcpy.na.GetNAClassNames(naLyr)["SALines"])[0]
+   elif naLyr.endswith(".lyrx"):
+      # This is used when the layer file (lyrx) is passed to the function
+      na_lyr = arcpy.mp.LayerFile(naLyr)
+      return na_lyr.listLayers("Lines")[0]
+   else:
+      # This is used when the map layer is passed to the function (in ArcPro GUI)
+      return naLyr + "\\Lines"
+
 def FillLines_scs(inLines, outFillLines, inFillTrace, maxFillLength=None, scratchGDB="in_memory"):
    """
    Using scsLine features and a downstream service area layer, finds and returns 'filler' segments
@@ -2100,14 +2217,10 @@ def FillLines_scs(inLines, outFillLines, inFillTrace, maxFillLength=None, scratc
    arcpy.management.MultipartToSinglepart(flowInt0, flowInt)
    # Add locations and solve
    arcpy.AddLocations_na(inFillTrace, "Facilities", flowInt, append="CLEAR")
-   printMsg("Solving service area for " + inFillTrace + "...")
+   printMsg("Solving service area for %s..." % inFillTrace)
    arcpy.Solve_na(inFillTrace, "SKIP", "TERMINATE")
    # Get lines layer
-   if inFillTrace.endswith(".lyrx"):
-      na_lyr = arcpy.mp.LayerFile(inFillTrace)
-      fillTrace = na_lyr.listLayers("Lines")[0]
-   else:
-      fillTrace = inFillTrace + "\Lines"
+   fillTrace = getServiceLines_scs(inFillTrace)
    # copy, erase inLines from filler segments
    fill0 = scratchGDB + os.sep + 'fill0'
    arcpy.CopyFeatures_management(fillTrace, fill0)
@@ -2134,7 +2247,7 @@ def FillLines_scs(inLines, outFillLines, inFillTrace, maxFillLength=None, scratc
    
    return outFillLines
 
-def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Lines, fld_Tidal = "Tidal", out_Scratch = "in_memory"): 
+def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Lines, fld_Tidal = "Tidal", out_Scratch = "in_memory", in_fillTrace = None): 
    """Loads SCS points derived from Procedural Features, solves the upstream, downstream, and tidal service layers, and combines network segments to create linear SCS.
    
    Parameters:
@@ -2145,10 +2258,12 @@ def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Line
    - in_tidalTrace = Network Analyst service layer set up to run upstream and downstream in tidal areas
    - out_Lines = Output lines representing Stream Conservation Units
    - fld_Tidal = field in in_Points indicating tidal status
-   - out_Scratch = Geodatabase to contain intermediate outputs"""
+   - out_Scratch = Geodatabase to contain intermediate outputs
+   - in_fillTrace = Network Analyst service layer used to fill small gaps between lines. If not given, the naFillTrace layer file 
+      saved alongside in_upTrace is used.
+   
+   The service layers may be layer files, map layers, or the layer objects returned by MakeServiceLayers_scs."""
    arcpy.CheckOutExtension("Network")
-   # Get description of service layers
-   descHydro = arcpy.Describe(in_upTrace)
    # timestamp
    t0 = datetime.now()
 
@@ -2160,12 +2275,18 @@ def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Line
    nontidalPts = out_Scratch + os.sep + "nontidalPts"
    # outDir = os.path.dirname(out_Lines)
    
-   # Split points into tidal and non-tidal layers
+   # Split points into tidal and non-tidal layers, in a single pass through the points
    printMsg("Splitting points into tidal vs non-tidal...")
-   qry = "%s = 1"%fld_Tidal
-   arcpy.Select_analysis(in_Points, tidalPts, qry)
-   qry = "%s = 0"%fld_Tidal
-   arcpy.Select_analysis(in_Points, nontidalPts, qry)
+   for pts in [tidalPts, nontidalPts]:
+      arcpy.CreateFeatureclass_management(out_Scratch, os.path.basename(pts), "POINT", in_Points, "SAME_AS_TEMPLATE", "SAME_AS_TEMPLATE", in_Points)
+   flds = ["SHAPE@"] + [f.name for f in arcpy.ListFields(in_Points) if f.editable and f.type not in ("OID", "Geometry")]
+   t = flds.index(fld_Tidal)
+   with arcpy.da.InsertCursor(tidalPts, flds) as tidalCursor, arcpy.da.InsertCursor(nontidalPts, flds) as nontidalCursor:
+      for row in arcpy.da.SearchCursor(in_Points, flds):
+         if row[t] == 1:
+            tidalCursor.insertRow(row)
+         elif row[t] == 0:
+            nontidalCursor.insertRow(row)
    
    # Load points as facilities into service layers; search distance 500 meters
    # Solve upstream and downstream service layers; save out lines and updated layers
@@ -2174,8 +2295,7 @@ def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Line
       inLyr = sa[0]
       inPoints = sa[1]
       outLines = sa[2]
-      count = countFeatures(inPoints)
-      if count > 0:
+      if hasFeatures(inPoints):
          printMsg("Loading points into service layer...")
          arcpy.na.AddLocations(in_network_analysis_layer = inLyr, 
          sub_layer = "Facilities", 
@@ -2201,17 +2321,10 @@ def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Line
             overrides = "")
 
          # Get lines layer
-         if inLyr.endswith(".lyrx"):
-            # This is used when the layer file (lyrx) is passed to the function
-            na_lyr = arcpy.mp.LayerFile(inLyr)
-            inLines = na_lyr.listLayers("Lines")[0]
-         else:
-            # This is used when the map layer is passed to the function (in ArcPro GUI)
-            inLines = inLyr + "\Lines"
+         inLines = getServiceLines_scs(inLyr)
 
          printMsg("Saving out lines...")
          arcpy.CopyFeatures_management(inLines, outLines)
-         arcpy.RepairGeometry_management(outLines, "DELETE_NULL")
          lines.append(outLines)
       else:
          pass
@@ -2220,16 +2333,18 @@ def CreateLines_scs(in_Points, in_downTrace, in_upTrace, in_tidalTrace, out_Line
    printMsg("Merging segments...")
    comboLines = out_Scratch + os.sep + "comboLines"
    arcpy.Merge_management(lines, comboLines)
+   arcpy.RepairGeometry_management(comboLines, "DELETE_NULL")
    
    # Unsplit lines
    UnsplitLines(comboLines, out_Lines)
    
    # This section finds small flowline gaps (up to 1-km) between scsLines. If any are found, it re-creates out_Lines, with gaps filled in
    if countFeatures(out_Lines) > 1:
-      in_fillTrace = os.path.join(descHydro.path, "naFillTrace.lyrx")
+      if in_fillTrace is None:
+         in_fillTrace = os.path.join(arcpy.Describe(in_upTrace).path, "naFillTrace.lyrx")
       fillLines = out_Scratch + os.sep + "fillLines"
       FillLines_scs(out_Lines, fillLines, in_fillTrace, scratchGDB=out_Scratch)
-      if countFeatures(fillLines) > 0:
+      if hasFeatures(fillLines):
          printMsg("Filling in small gaps...")
          newLines = out_Scratch + os.sep + 'newLines'
          arcpy.Merge_management([out_Lines, fillLines], newLines)
@@ -2267,7 +2382,7 @@ def BufferLines_scs(in_Lines, in_StreamRiver, in_LakePond, in_Catch, out_Buffers
    StreamRiverBuff = out_Scratch + os.sep + "StreamRiverBuff"
    LakePondBuff = out_Scratch + os.sep + "LakePondBuff"
    LineBuff = out_Scratch + os.sep + "LineBuff"
-   mergeBuff = out_Scratch + os.sep + "mergeBuff"
+   mergeBuff = "memory" + os.sep + "mergeBuff" # only feeds the dissolve, so always kept in memory
    dissBuff = out_Scratch + os.sep + "dissBuff"
    
    # Clip input layers to catchments
@@ -2290,13 +2405,13 @@ def BufferLines_scs(in_Lines, in_StreamRiver, in_LakePond, in_Catch, out_Buffers
    
    # Buffer SCS lines and selected NHD polygons
    printMsg("Buffering StreamRiver polygons...")
-   arcpy.Buffer_analysis("StreamRivers", StreamRiverBuff, buffDist, "", "ROUND", "NONE")
+   arcpy.analysis.PairwiseBuffer("StreamRivers", StreamRiverBuff, buffDist, "NONE")
    
    printMsg("Buffering LakePond polygons...")
-   arcpy.Buffer_analysis("LakePonds", LakePondBuff, buffDist, "", "ROUND", "NONE")
+   arcpy.analysis.PairwiseBuffer("LakePonds", LakePondBuff, buffDist, "NONE")
    
    printMsg("Buffering SCS lines...")
-   arcpy.Buffer_analysis(in_Lines, LineBuff, buffDist, "", "ROUND", "NONE")
+   arcpy.analysis.PairwiseBuffer(in_Lines, LineBuff, buffDist, "NONE")
    
    # Merge buffers and dissolve
    printMsg("Merging buffer polygons...")
@@ -2304,13 +2419,155 @@ def BufferLines_scs(in_Lines, in_StreamRiver, in_LakePond, in_Catch, out_Buffers
    
    printMsg("Dissolving...")
    arcpy.PairwiseDissolve_analysis(mergeBuff, dissBuff, multi_part="SINGLE_PART")
+   garbagePickup([mergeBuff])
    
    # Clip buffers to catchment
    printMsg("Clipping buffer zone to catchments...")
    CleanClip(dissBuff, in_Catch, out_Buffers)
    
+   # Cleanup
+   if out_Scratch in ("in_memory", "memory"):
+      garbagePickup([clipRiverPoly, clipLakePoly, StreamRiverBuff, LakePondBuff, LineBuff, dissBuff])
+   
    return out_Buffers
 
+def FlowBuffLines_scs(in_Lines, in_PF, in_Catch, in_NHDArea, in_NHDWaterbody, in_FlowBuff, out_FlowPolys, buffDist = 150, scuSwitch = False, lineIDs = None):
+   """Clips the flow buffers to the clipping buffer around each SCS line, and adds the resulting polygons to an existing feature class. This function is called by the 
+   DelinSite_scs function, either directly or from worker processes.
+   
+   Parameters:
+   - in_Lines: Input SCS lines, generated as output from CreateLines_scs function
+   - in_PF: Input Procedural Features
+   - in_Catch: Input catchments from NHDPlus
+   - in_NHDArea: Input NHDArea polygons
+   - in_NHDWaterbody: Input NHDWaterbody polygons
+   - in_FlowBuff: Input flow buffer polygons (see DelinSite_scs)
+   - out_FlowPolys: Existing polygon feature class to which the clipped flow buffers are added
+   - buffDist: Buffer distance used to make clipping buffers
+   - scuSwitch: Whether to apply the SCU-specific cleanup (True) or the SCS-specific cleanup (False)
+   - lineIDs: ObjectIDs of the lines to process. If None (default), all lines are processed.
+   """
+   # Make feature layers
+   printMsg("Making feature layers...")
+   qry = "FType = 460" # StreamRiver only
+   lyrStreamRiver = arcpy.MakeFeatureLayer_management(in_NHDArea, "StreamRiver_Poly", qry)
+   qry = "FType = 390" # LakePond only
+   lyrLakePond = arcpy.MakeFeatureLayer_management(in_NHDWaterbody, "LakePond_Poly", qry)
+   lyrPF = arcpy.MakeFeatureLayer_management(in_PF)
+   catch = arcpy.MakeFeatureLayer_management(in_Catch, "lyr_CatchLines")
+   
+   ### Variables used repeatedly in loop
+   # These are overwritten for every line, so they are kept in the "memory" workspace and deleted at the end of each iteration
+   loopScratch = "memory"
+   dissCatch = loopScratch + os.sep + "dissCatch"
+   clipBuff = loopScratch + os.sep + "clipBuff"
+   flowPoly0 = loopScratch + os.sep + "flowPoly0"
+   flowPoly1 = loopScratch + os.sep + "flowPoly1"
+   dissFlow = loopScratch + os.sep + "dissFlow"
+   elimFlow = loopScratch + os.sep + "flowPoly"
+   
+   flowSub = loopScratch + os.sep + "flowSub"
+   
+   # Read the lines up front, so no cursor is held open while the geoprocessing tools run in the loop
+   if lineIDs is None:
+      lineQry = None
+   else:
+      lineQry = "%s IN (%s)" %(GetFlds(in_Lines, True), ",".join([str(i) for i in lineIDs]))
+   myLines = [row for row in arcpy.da.SearchCursor(in_Lines, ["SHAPE@", "OID@"], lineQry)]
+   if not myLines:
+      return out_FlowPolys
+   arcpy.env.extent = "MAXOF"
+   
+   # Copy the flow buffers within reach of these lines to memory once, so the clip in the loop does not have to read the full dataset for every line.
+   # This repeats the catchment selection made for each line in the loop, for all lines at once.
+   printMsg("Copying relevant flow buffers to memory...")
+   lyrLines = arcpy.MakeFeatureLayer_management(in_Lines, "lyr_FlowLines", lineQry)
+   arcpy.SelectLayerByLocation_management(catch, "INTERSECT", lyrLines)
+   arcpy.SelectLayerByLocation_management(lyrPF, "INTERSECT", catch)
+   arcpy.SelectLayerByLocation_management(catch, "INTERSECT", lyrPF, selection_type="ADD_TO_SELECTION")
+   lyrFlow = arcpy.MakeFeatureLayer_management(in_FlowBuff, "lyr_FlowBuffSub")
+   arcpy.SelectLayerByLocation_management(lyrFlow, "INTERSECT", catch)
+   arcpy.CopyFeatures_management(lyrFlow, flowSub)
+   ensureSpatialIndex(flowSub, warn = False)
+   
+   for line in myLines:
+      try:
+         lineShp = line[0]
+         lineID = line[1]
+                     
+         # Select catchments intersecting SCS Line
+         printMsg("Selecting catchments containing SCS line...")
+         arcpy.SelectLayerByLocation_management(catch, "INTERSECT", lineShp)
+            
+         # find PFs intersecting catchments (PFs sometimes extend outside of initial catchment selection, generally in widewater areas)
+         arcpy.SelectLayerByLocation_management(lyrPF, "INTERSECT", catch)
+         # now add to selection the catchments intersecting PFs
+         arcpy.SelectLayerByLocation_management(catch, "INTERSECT", lyrPF, selection_type="ADD_TO_SELECTION")
+
+         # Dissolve catchments
+         printMsg("Dissolving catchments...")
+         arcpy.PairwiseDissolve_analysis(catch, dissCatch, multi_part="SINGLE_PART")
+         
+         # Select the NHD polygons in the catchments, so the clips in BufferLines_scs only have to read those
+         arcpy.SelectLayerByLocation_management(lyrStreamRiver, "INTERSECT", dissCatch)
+         arcpy.SelectLayerByLocation_management(lyrLakePond, "INTERSECT", dissCatch)
+         
+         # Create clipping buffer
+         printMsg("Creating clipping buffer...")
+         BufferLines_scs(lineShp, lyrStreamRiver, lyrLakePond, dissCatch, clipBuff, loopScratch, buffDist)
+
+         # Clip the flow buffer to the clipping buffer 
+         printMsg("Clipping the flow buffer ...")
+         arcpy.PairwiseClip_analysis(flowSub, clipBuff, flowPoly0)
+            
+         # This section cleans up artifacts specific to SCU or SCS.
+         if scuSwitch:
+            # For SCUs, Eliminate small dangling pieces which may have resulted from clip. 
+            #  These can result becuase the flow buffers and catchments do not always perfectly align with 
+            #  flowlines, which rarely can spill over into a neighboring catchment/flow buffer.
+            printMsg("Eliminating fragments...")
+            arcpy.PairwiseDissolve_analysis(flowPoly0, dissFlow)
+            arcpy.EliminatePolygonPart_management(dissFlow, elimFlow, "AREA", part_area="500 SQUAREMETERS", part_option="ANY")
+            flowPieces = [row[0] for row in arcpy.da.SearchCursor(elimFlow, ["SHAPE@"])]
+         else:
+            # For SCS, select using line shape and PFs. This will exclude non-hydro-connected 
+            #  pieces of flow buffer which were picked up by a line buffer that extends beyond its catchment. 
+            # The pieces and PFs involved are few, so they are compared as geometries rather than through a new layer each time.
+            arcpy.MultipartToSinglepart_management(flowPoly0, flowPoly1)
+            pfShapes = [row[0] for row in arcpy.da.SearchCursor(lyrPF, ["SHAPE@"])]
+            allPieces = [row[0] for row in arcpy.da.SearchCursor(flowPoly1, ["SHAPE@"])]
+            flowPieces = [p for p in allPieces if not p.disjoint(lineShp) or any(not p.disjoint(pf) for pf in pfShapes)]
+            if not flowPieces:
+               # Same as appending from a layer with an empty selection
+               flowPieces = allPieces
+            
+         printMsg("Appending feature %s..." %lineID)
+         with arcpy.da.InsertCursor(out_FlowPolys, ["SHAPE@"]) as cursor:
+            for p in flowPieces:
+               cursor.insertRow([p])
+
+      except:
+         printMsg("Process failure for feature %s. Passing..." %lineID)
+         tback()
+      
+      finally:
+         garbagePickup([dissCatch, clipBuff, flowPoly0, flowPoly1, dissFlow, elimFlow])
+   
+   garbagePickup([flowSub])
+   return out_FlowPolys
+
+def _run_flowBuffLines(lineIDs, in_Lines, in_PF, in_Catch, in_NHDArea, in_NHDWaterbody, in_FlowBuff, buffDist, scuSwitch, outGDB):
+   '''Worker function for DelinSite_scs. Runs FlowBuffLines_scs on a batch of lines in its own process, writing to its own geodatabase, so it must stay at module level to be picklable.'''
+   import arcpy
+   arcpy.env.overwriteOutput = True
+   arcpy.env.parallelProcessingFactor = "0" # avoid oversubscribing cores already used by sibling workers
+   arcpy.management.CreateFileGDB(os.path.dirname(outGDB), os.path.basename(outGDB))
+   sr = arcpy.da.Describe(in_FlowBuff)["spatialReference"]
+   arcpy.management.CreateFeatureclass(outGDB, "flowBuffers", "POLYGON", in_Catch, "", "", sr)
+   out_FlowPolys = outGDB + os.sep + "flowBuffers"
+   FlowBuffLines_scs(in_Lines, in_PF, in_Catch, in_NHDArea, in_NHDWaterbody, in_FlowBuff, out_FlowPolys, buffDist, scuSwitch, lineIDs)
+   return out_FlowPolys
+
 def DelinSite_scs(in_PF, in_Lines, in_Catch, in_hydroNet, in_ConSites, out_ConSites, in_FlowBuff, fld_Rule = "RULE", trim = "true", buffDist = 150, out_Scratch = "in_memory"):
    """Creates Stream Conservation Sites.
    
@@ -2332,6 +2589,13 @@ def DelinSite_scs(in_PF, in_Lines, in_Catch, in_hydroNet, in_ConSites, out_ConSi
    # timestamp
    t0 = datetime.now()
    
+   # Let the pairwise tools use all available cores
+   arcpy.env.parallelProcessingFactor = "100%"
+   
+   # The inputs are all used in location queries below, which fall back to full scans without a spatial index
+   for fc in [in_PF, in_Lines, in_Catch]:
+      ensureSpatialIndex(fc)
+   
    # Declare path/name of output data and workspace
    drive, path = os.path.splitdrive(out_ConSites)
    path, filename = os.path.split(path)
@@ -2353,28 +2617,27 @@ def DelinSite_scs(in_PF, in_Lines, in_Catch, in_hydroNet, in_ConSites, out_ConSi
    if trim == "true":
       # In this case you have to run line buffers in a loop to avoid aberrations
       # Set up some variables
-      descHydro = arcpy.Describe(in_hydroNet)
-      nwDataset = descHydro.catalogPath
-      catPath = os.path.dirname(nwDataset) # This is where hydro layers will be found
+      nwDataset, catPath, hydroDir = getHydroPaths(in_hydroNet) # catPath is where hydro layers will be found
       nhdArea = catPath + os.sep + "NHDArea"
       nhdWaterbody = catPath + os.sep + "NHDWaterbody"
             
-      ### Variables used repeatedly in loop
-      dissCatch = out_Scratch + os.sep + "dissCatch"
-      clipBuff = out_Scratch + os.sep + "clipBuff"
-            
-      # Make feature layers
-      printMsg("Making feature layers...")
-      qry = "FType = 460" # StreamRiver only
-      lyrStreamRiver = arcpy.MakeFeatureLayer_management(nhdArea, "StreamRiver_Poly", qry)
-      qry = "FType = 390" # LakePond only
-      lyrLakePond = arcpy.MakeFeatureLayer_management(nhdWaterbody, "LakePond_Poly", qry)
-      catch = arcpy.MakeFeatureLayer_management(in_Catch, "lyr_Catchments")
-      lyrPF = arcpy.MakeFeatureLayer_management(in_PF)
+      # The flow buffers and NHD polygons are queried by location for every line, so make sure they have spatial indexes
+      for fc in [in_FlowBuff, nhdArea, nhdWaterbody]:
+         ensureSpatialIndex(fc)
+      
+      # Only catchments intersecting the lines or PFs can be selected in the loop, so copy those to memory to work from
+      printMsg("Copying relevant catchments to memory...")
+      catchSrc = arcpy.MakeFeatureLayer_management(in_Catch, "lyr_CatchSrc")
+      arcpy.SelectLayerByLocation_management(catchSrc, "INTERSECT", in_Lines)
+      arcpy.SelectLayerByLocation_management(catchSrc, "INTERSECT", in_PF, selection_type="ADD_TO_SELECTION")
+      catchSub = "memory" + os.sep + "catchSub"
+      arcpy.CopyFeatures_management(catchSrc, catchSub)
+      ensureSpatialIndex(catchSub, warn = False)
+      catch = arcpy.MakeFeatureLayer_management(catchSub, "lyr_Catchments")
       
       # Create empty feature class to store flow buffers
       printMsg("Creating empty feature class for flow buffers")
-      sr = arcpy.Describe(in_FlowBuff).spatialReference
+      sr = arcpy.da.Describe(in_FlowBuff)["spatialReference"]
       fname = "flowBuffers"
       fpath = out_Scratch
       flowBuff = fpath + os.sep + fname
@@ -2383,68 +2646,54 @@ def DelinSite_scs(in_PF, in_Lines, in_Catch, in_hydroNet, in_ConSites, out_ConSi
          arcpy.Delete_management(flowBuff)
       arcpy.CreateFeatureclass_management(fpath, fname, "POLYGON", in_Catch, "", "", sr)
       
-      with arcpy.da.SearchCursor(in_Lines, ["SHAPE@", "OBJECTID"]) as myLines:
-         for line in myLines:
-            try:
-               lineShp = line[0]
-               lineID = line[1]
-               arcpy.env.extent = "MAXOF"
-                        
-               # Select catchments intersecting SCS Line
-               printMsg("Selecting catchments containing SCS line...")
-               arcpy.SelectLayerByLocation_management(catch, "INTERSECT", lineShp)
-               
-               # find PFs intersecting catchments (PFs sometimes extend outside of initial catchment selection, generally in widewater areas)
-               arcpy.SelectLayerByLocation_management(lyrPF, "INTERSECT", catch)
-               # now add to selection the catchments intersecting PFs
-               arcpy.SelectLayerByLocation_management(catch, "INTERSECT", lyrPF, selection_type="ADD_TO_SELECTION")
-   
-               # Dissolve catchments
-               printMsg("Dissolving catchments...")
-               arcpy.PairwiseDissolve_analysis(catch, dissCatch, multi_part="SINGLE_PART")
-            
-               # Create clipping buffer
-               printMsg("Creating clipping buffer...")
-               BufferLines_scs(lineShp, lyrStreamRiver, lyrLakePond, dissCatch, clipBuff, out_Scratch, buffDist)
-
-               # Clip the flow buffer to the clipping buffer 
-               printMsg("Clipping the flow buffer ...")
-               arcpy.env.extent = clipBuff
-               flowPoly0 = out_Scratch + os.sep + "flowPoly0"
-               arcpy.PairwiseClip_analysis(in_FlowBuff, clipBuff, flowPoly0)
-               
-               # This section cleans up artifacts specific to SCU or SCS.
-               if scuSwitch:
-                  # For SCUs, Eliminate small dangling pieces which may have resulted from clip. 
-                  #  These can result becuase the flow buffers and catchments do not always perfectly align with 
-                  #  flowlines, which rarely can spill over into a neighboring catchment/flow buffer.
-                  printMsg("Eliminating fragments...")
-                  dissFlow = out_Scratch + os.sep + "dissFlow"
-                  arcpy.PairwiseDissolve_analysis(flowPoly0, dissFlow)
-                  flowPoly = out_Scratch + os.sep + "flowPoly"
-                  arcpy.EliminatePolygonPart_management(dissFlow, flowPoly, "AREA", part_area="500 SQUAREMETERS", part_option="ANY")
-               else:
-                  # For SCS, select using line shape and PFs. This will exclude non-hydro-connected 
-                  #  pieces of flow buffer which were picked up by a line buffer that extends beyond its catchment. 
-                  flowPoly1 = out_Scratch + os.sep + "flowPoly1"
-                  arcpy.MultipartToSinglepart_management(flowPoly0, flowPoly1)
-                  flowPoly = arcpy.MakeFeatureLayer_management(flowPoly1)
-                  arcpy.SelectLayerByLocation_management(flowPoly, "INTERSECT", lineShp)
-                  arcpy.SelectLayerByLocation_management(flowPoly, "INTERSECT", lyrPF, selection_type="ADD_TO_SELECTION")
-               
-               printMsg("Appending feature %s..." %lineID)
-               arcpy.Append_management(flowPoly, flowBuff, "NO_TEST")
-
-            except:
-               printMsg("Process failure for feature %s. Passing..." %lineID)
-               tback()
+      # The lines are independent of each other, so batches of lines are farmed out to worker processes. 
+      # Workers can only see data on disk, so layers (which may carry selections or definition queries) and data in memory workspaces are processed serially instead.
+      # Workers take several seconds to start up, so each one should get at least 10 lines to be worthwhile.
+      lineIDs = [row[0] for row in arcpy.da.SearchCursor(in_Lines, ["OID@"])]
+      inList = [in_PF, in_Lines, in_Catch, in_FlowBuff]
+      inTypes = [getDataType(fc) for fc in inList]
+      inMemory = any(str(fc).replace("/", "\\").split("\\")[0].lower() in ("in_memory", "memory") for fc in inList)
+      numWorkers = min(len(lineIDs) // 10, os.cpu_count() or 1)
+      if "FeatureLayer" in inTypes or inMemory or numWorkers < 2:
+         FlowBuffLines_scs(in_Lines, in_PF, catchSub, nhdArea, nhdWaterbody, in_FlowBuff, flowBuff, buffDist, scuSwitch)
+      else:
+         setPythonExecutable()
+         printMsg("Processing %s lines using %s worker processes..." %(len(lineIDs), numWorkers))
+         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+         workerGDBs = []
+         failList = []
+         with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+            futures = {}
+            for i in range(numWorkers):
+               workerGDB = arcpy.env.scratchFolder + os.sep + "flowBuff_%s_%s.gdb" %(ts, i)
+               workerGDBs.append(workerGDB)
+               futures[executor.submit(_run_flowBuffLines, lineIDs[i::numWorkers], in_Lines, in_PF, in_Catch, nhdArea, nhdWaterbody, in_FlowBuff, buffDist, scuSwitch, workerGDB)] = i
+            for f in as_completed(futures):
+               i = futures[f]
+               try:
+                  workerBuff = f.result()
+                  printMsg("Appending flow buffers from %s..." %os.path.dirname(workerBuff))
+                  appendShapes(workerBuff, flowBuff)
+               except:
+                  printWrng("Worker process failed for features %s" %lineIDs[i::numWorkers])
+                  tback()
+                  failList.append(lineIDs[i::numWorkers])
+               finally:
+                  garbagePickup([workerGDBs[i]])
+         
+         # Retry the cleanup for any worker geodatabases that were still locked while the workers were running
+         garbagePickup([gdb for gdb in workerGDBs if arcpy.Exists(gdb)])
+         
+         # Rerun any failed batches here, so no lines are lost. Failures of individual lines are still handled within FlowBuffLines_scs.
+         for batch in failList:
+            printMsg("Reprocessing features %s..." %batch)
+            FlowBuffLines_scs(in_Lines, in_PF, catchSub, nhdArea, nhdWaterbody, in_FlowBuff, flowBuff, buffDist, scuSwitch, lineIDs=batch)
 
       arcpy.env.extent = flowBuff  # "MAXOF"
       # Burn in full catchments for alternate-process PFs
       qry = "%s = 'SCS2'"%fld_Rule
       altPF = arcpy.MakeFeatureLayer_management(in_PF, "lyr_altPF", qry)
-      count = countFeatures(altPF)
-      if count > 0:
+      if hasFeatures(altPF):
          arcpy.SelectLayerByLocation_management(catch, "INTERSECT", altPF, "", "NEW_SELECTION")
          printMsg("Appending full catchments for selected features...")
          if scuSwitch:
@@ -2454,10 +2703,11 @@ def DelinSite_scs(in_PF, in_Lines, in_Catch, in_hydroNet, in_ConSites, out_ConSi
             arcpy.PairwiseDissolve_analysis(catch, fullCatch, multi_part="SINGLE_PART")
             fullCatchSmth = out_Scratch + os.sep + "fullCatchSmth"
             arcpy.cartography.SmoothPolygon(fullCatch, fullCatchSmth, "PAEK", "50 METERS")
-            arcpy.Append_management(fullCatchSmth, flowBuff, "NO_TEST")
+            appendShapes(fullCatchSmth, flowBuff)
          else:
-            arcpy.Append_management(catch, flowBuff, "NO_TEST")
+            appendShapes(catch, flowBuff)
       in_Polys = flowBuff
+      garbagePickup([catch, catchSub])
    else:
       # Select catchments intersecting SCS Lines
       printMsg("Selecting catchments containing SCS lines...")
@@ -11,7 +11,8 @@
 
 # Import modules
 print("Initiating arcpy, which takes longer than it should...")
-import arcpy, os, sys, traceback, numpy, pandas, time
+import arcpy, os, sys, traceback, numpy, pandas, time, multiprocessing
+from functools import lru_cache
 from datetime import datetime as datetime
 
 # Set overwrite option so that existing data may be overwritten
@@ -95,6 +96,39 @@ def garbagePickup(trashList):
          pass
    return
 
+def appendShapes(inFeats, outFeats):
+   '''Appends the geometries of the input features to the output feature class, without attributes. Faster than Append for outputs where only the shapes are needed.'''
+   with arcpy.da.InsertCursor(outFeats, ["SHAPE@"]) as outCursor:
+      with arcpy.da.SearchCursor(inFeats, ["SHAPE@"]) as inCursor:
+         for row in inCursor:
+            outCursor.insertRow(row)
+   return outFeats
+
+def fillHoles(shp, pctArea):
+   '''Returns a copy of the input polygon geometry with holes filled. A hole is filled if its area is less than the specified percentage of the area within its outer ring. This is the geometry equivalent of EliminatePolygonPart with the PERCENT and CONTAINED_ONLY options.'''
+   sr = shp.spatialReference
+   outShp = None
+   for part in shp:
+      # Rings within a part are separated by null points; the first ring is the outer ring
+      rings = [[]]
+      for pt in part:
+         if pt is None:
+            rings.append([])
+         else:
+            rings[-1].append(pt)
+      outer = arcpy.Polygon(arcpy.Array(rings[0]), sr)
+      # Cut the kept holes from this part only, so an island part lying within another part's hole is not erased
+      partShp = outer
+      for ring in rings[1:]:
+         hole = arcpy.Polygon(arcpy.Array(ring), sr)
+         if hole.area >= outer.area * pctArea / 100:
+            partShp = partShp.difference(hole)
+      if outShp is None:
+         outShp = partShp
+      else:
+         outShp = outShp.union(partShp)
+   return outShp
+
 def copyLayersToGDB(inLayers, outGDB):
    '''A function to quickly copy a set of layers to a local geodatabase.
    Parameters:
@@ -214,6 +248,11 @@ def countFeatures(features):
    count = int((arcpy.GetCount_management(features)).getOutput(0))
    return count
    
+def hasFeatures(features):
+   '''Returns True if the input has at least one feature (or selected feature, for a layer with a selection). Stops reading after the first row, so it is cheaper than countFeatures when only an "any?" check is needed.'''
+   with arcpy.da.SearchCursor(features, ["OID@"]) as cursor:
+      return next(iter(cursor), None) is not None
+   
 def countSelectedFeatures(featureLyr):
    '''Gets count of selected features in a feature layer. It seems like there ought to be an easier way than this but...'''
    desc = arcpy.Describe(featureLyr)
@@ -223,6 +262,11 @@ def countSelectedFeatures(featureLyr):
       count = len(set.split(";"))
    return count
 
+def getSelectedOIDs(featureLyr):
+   '''Returns a list of the ObjectIDs of the currently selected features in a feature layer (an empty list if there is no selection)'''
+   desc = arcpy.Describe(featureLyr)
+   return [int(i) for i in desc.FIDSet.split(";") if i.strip()]
+
 def SelectCopy(in_FeatLyr, selFeats, selDist, out_Feats):
    '''Selects features within specified distance of selection features, and copies to output.
    Input features to be selected must be a layer, not a feature class.
@@ -253,25 +297,29 @@ def ExpandSelection(inLyr, SearchDist):
    - SearchDist: distance within which features should be added to the selection
    '''
    
-   c = countSelectedFeatures(inLyr)
-   # printMsg("%s features are selected"%str(c))
-   if c == 0:
+   selected = set(getSelectedOIDs(inLyr))
+   # printMsg("%s features are selected"%str(len(selected)))
+   if len(selected) == 0:
       printErr("You need to have an active selection on the input layer for this function to work.")
    else:
-      # Initialize row count variables
-      c0 = 0
-      c1 = 1
+      src = arcpy.Describe(inLyr).catalogPath
+      oidFld = GetFlds(src, oid_only=True)
       
-      while c0 < c1:
-         # Keep adding to the selection as long as the counts of selected records keep changing
-         # Get count of records in initial selection
-         c0 = countSelectedFeatures(inLyr)
+      # Keep adding to the selection as long as new records are being selected. 
+      # Only the features added in the previous pass (the frontier) are used to select, since the rest have already been searched around.
+      frontier = selected
+      while frontier:
+         qry = "%s IN (%s)" % (oidFld, ",".join([str(i) for i in frontier]))
+         arcpy.management.MakeFeatureLayer(src, "frontier_lyr", qry)
          
-         # Select features within distance of current selection
-         arcpy.management.SelectLayerByLocation(inLyr, "WITHIN_A_DISTANCE", inLyr, SearchDist, "ADD_TO_SELECTION")
+         # Select features within distance of the frontier
+         arcpy.management.SelectLayerByLocation(inLyr, "WITHIN_A_DISTANCE", "frontier_lyr", SearchDist, "ADD_TO_SELECTION")
+         arcpy.management.Delete("frontier_lyr")
          
-         # Get updated selection count
-         c1 = countSelectedFeatures(inLyr)
+         # Get the newly selected records
+         newSel = set(getSelectedOIDs(inLyr))
+         frontier = newSel - selected
+         selected = newSel
       
    return inLyr
       
@@ -346,6 +394,13 @@ def createTmpWorkspace():
    
    return tmpWorkspace
 
+def setPythonExecutable():
+   '''Points the multiprocessing module at the Python interpreter of the active environment. This is needed for worker processes spawned from within ArcGIS Pro, where sys.executable is ArcGISPro.exe rather than python.exe.'''
+   pyExe = os.path.join(sys.exec_prefix, "python.exe")
+   if os.path.exists(pyExe):
+      multiprocessing.set_executable(pyExe)
+   return
+
 def tback():
    '''Standard error handling routing to add to bottom of scripts'''
    tb = sys.exc_info()[2]
@@ -360,8 +415,47 @@ def tback():
    
    return msgList
    
+@lru_cache(maxsize=None)
+def _cachedDataType(name):
+   return arcpy.Describe(name).dataType
+
+def getDataType(fc):
+   '''Returns the data type of the input (e.g., 'FeatureLayer' or 'FeatureClass'). Results are cached by name, so repeated checks on the same input do not re-read the catalog. Inputs that cannot be cached (e.g., layer objects) are described directly.'''
+   try:
+      return _cachedDataType(fc)
+   except TypeError:
+      return arcpy.Describe(fc).dataType
+
+@lru_cache(maxsize=None)
+def _cachedHydroPaths(name):
+   nwDataset = arcpy.da.Describe(name)["catalogPath"]
+   catPath = os.path.dirname(nwDataset)
+   hydroDir = os.path.dirname(os.path.dirname(catPath))
+   return (nwDataset, catPath, hydroDir)
+
+def getHydroPaths(in_hydroNet):
+   '''Returns a tuple of paths associated with the input hydro network dataset: (network dataset path, feature dataset containing the hydro layers, directory where layer files are saved). Results are cached by name, so the network is only described once per session.'''
+   try:
+      return _cachedHydroPaths(in_hydroNet)
+   except TypeError:
+      return _cachedHydroPaths.__wrapped__(in_hydroNet)
+
+def ensureSpatialIndex(fc, warn = True):
+   '''Adds a spatial index to the input feature class (or the source of the input layer) if it does not already have one. Returns True if the data has a spatial index on exit. If warn is True, a warning is printed when the index has to be built, since location queries against unindexed data fall back to full scans.'''
+   try:
+      desc = arcpy.Describe(fc)
+      if desc.dataType == "FeatureLayer":
+         desc = arcpy.Describe(desc.catalogPath)
+      if not desc.hasSpatialIndex:
+         if warn:
+            printWrng("Warning: %s has no spatial index; location queries against it will be slow. Building one now..." %desc.catalogPath)
+         arcpy.management.AddSpatialIndex(desc.catalogPath)
+      return True
+   except:
+      return False
+
 def clearSelection(fc):
-   typeFC = (arcpy.Describe(fc)).dataType
+   typeFC = getDataType(fc)
    if typeFC == 'FeatureLayer':
       arcpy.SelectLayerByAttribute_management(fc, "CLEAR_SELECTION")
       
@@ -623,6 +717,48 @@ def clipRasterToPoly(in_Rast, in_Poly, out_Rast):
    
    return out_Rast
    
+def calcRasterByBlock(in_Rasts, calcFunc, out_Rast, nodataVals = None, blockSize = 4096, scratchGDB = None):
+   '''Applies a numpy function to one or more rasters one block at a time, so that memory use is bounded by the block size rather than the raster size. Blocks are written to temporary rasters, then mosaicked into the output.
+   
+   Parameters:
+   - in_Rasts: list of input Raster objects. The first raster defines the output grid and spatial reference; the others are read on that grid, so they should share its cell size and alignment.
+   - calcFunc: function taking one array per input raster (in the same order) and returning an unsigned 8-bit array, in which 0 represents NoData
+   - out_Rast: output raster
+   - nodataVals: optional list of values to assign to NoData cells, one per input raster. If not specified (or None for a given raster), the raster's own NoData value is used.
+   - blockSize: number of rows and columns per block
+   - scratchGDB: geodatabase to store temporary block rasters. If not specified, the scratch geodatabase is used.
+   '''
+   if not scratchGDB:
+      scratchGDB = arcpy.env.scratchGDB
+   if nodataVals is None:
+      nodataVals = [None for r in in_Rasts]
+   
+   refRast = in_Rasts[0]
+   cellX = refRast.meanCellWidth
+   cellY = refRast.meanCellHeight
+   
+   blockList = []
+   for r0 in range(0, refRast.height, blockSize):
+      for c0 in range(0, refRast.width, blockSize):
+         nrows = min(blockSize, refRast.height - r0)
+         ncols = min(blockSize, refRast.width - c0)
+         # Rows are counted down from the top of the raster, but blocks are placed by their lower left corner
+         lowerLeft = arcpy.Point(refRast.extent.XMin + c0*cellX, refRast.extent.YMax - (r0 + nrows)*cellY)
+         arrList = [arcpy.RasterToNumPyArray(r, lowerLeft, ncols, nrows, v) for r, v in zip(in_Rasts, nodataVals)]
+         outArr = calcFunc(*arrList)
+         tmpBlock = scratchGDB + os.sep + "tmpBlock%s" % len(blockList)
+         arcpy.NumPyArrayToRaster(outArr, lowerLeft, cellX, cellY, 0).save(tmpBlock)
+         blockList.append(tmpBlock)
+   
+   # Mosaic the blocks into the first one, then copy to the output
+   if len(blockList) > 1:
+      arcpy.management.Mosaic(blockList[1:], blockList[0], "LAST", "FIRST", "", 0)
+   arcpy.management.CopyRaster(blockList[0], out_Rast, nodata_value=0, pixel_type="8_BIT_UNSIGNED")
+   arcpy.management.DefineProjection(out_Rast, refRast.spatialReference)
+   garbagePickup(blockList)
+   
+   return out_Rast
+
 def shiftAlignToFlow(inFeats, outFeats, fldID, in_hydroNet, in_Catch, scratchGDB = "in_memory"):
    '''Shifts features to align with flowlines.
    Incorporates variation on code found here: https://arcpy.wordpress.com/2012/11/15/shifting-features/
@@ -638,9 +774,7 @@ def shiftAlignToFlow(inFeats, outFeats, fldID, in_hydroNet, in_Catch, scratchGDB
    '''
    
    # Set up some variables
-   descHydro = arcpy.Describe(in_hydroNet)
-   nwDataset = descHydro.catalogPath
-   catPath = os.path.dirname(nwDataset) # This is where hydro layers will be found
+   nwDataset, catPath, hydroDir = getHydroPaths(in_hydroNet) # catPath is where hydro layers will be found
    nhdFlowline = catPath + os.sep + "NHDFlowline"
    nhdArea = catPath + os.sep + "NHDArea"
    nhdWaterbody = catPath + os.sep + "NHDWaterbody"
@@ -1068,19 +1202,21 @@ def flattenFeatures(inFeat, outFeat, sortBy, scratchGDB = None):
    - outConsLands: Output planar feature class.
    - sortBy: Fields to sort by. In areas where features overlap, the highest ranking feature according to the sort 
       order will be retained. The output feature class will be dissolved by the attribute(s) listed here.
-   - scratchGDB: Geodatabase for storing scratch products
+   - scratchGDB: Geodatabase for storing scratch products. If not specified, the "memory" workspace is used.
    '''
    if not scratchGDB:
-      scratchGDB = "in_memory"
+      scratchGDB = "memory"
    diss_fld = [a[0] for a in sortBy]
    printMsg("Making flat dataset from: " + inFeat)
    tmp_sort = scratchGDB + os.sep + "tmp_sort"
    arcpy.Sort_management(inFeat, tmp_sort, sortBy)
    tmp_union = scratchGDB + os.sep + "tmp_union"
    arcpy.Union_analysis(tmp_sort, tmp_union)
+   garbagePickup([tmp_sort])
    # Delete lower-ranking polygons in areas of overlap
    arcpy.DeleteIdentical_management(tmp_union, fields="Shape")
    # final dissolve
    arcpy.PairwiseDissolve_analysis(tmp_union, outFeat, diss_fld, multi_part="SINGLE_PART")  # this dissolve results in multi_parts
+   garbagePickup([tmp_union])
    printMsg("Dataset " + outFeat + " created.")
    return outFeat
@@ -233,7 +233,7 @@ def main():
          printMsg("Creating service layers...")
          tStart = datetime.now()
          printMsg("Processing started at %s on %s" %(tStart.strftime("%H:%M:%S"), tStart.strftime("%Y-%m-%d")))
-         (lyrDownTrace, lyrUpTrace, lyrTidalTrace) = MakeServiceLayers_scs(in_hydroNet, in_Dams)
+         (lyrDownTrace, lyrUpTrace, lyrTidalTrace, lyrFillTrace) = MakeServiceLayers_scs(in_hydroNet, in_Dams, save_lyrx=False)
          tEnd = datetime.now()
          printMsg("Service layers creation ended at %s" %tEnd.strftime("%H:%M:%S"))
          deltaString = GetElapsedTime(tStart, tEnd)
@@ -253,7 +253,7 @@ def main():
          printMsg("Creating SCS lines...")
          tStart = datetime.now()
          printMsg("Processing started at %s on %s" %(tStart.strftime("%H:%M:%S"), tStart.strftime("%Y-%m-%d")))
-         CreateLines_scs(scsPts, lyrDownTrace, lyrUpTrace, lyrTidalTrace, scsLines, fld_Tidal, scratchGDB)
+         CreateLines_scs(scsPts, lyrDownTrace, lyrUpTrace, lyrTidalTrace, scsLines, fld_Tidal, scratchGDB, lyrFillTrace)
          tEnd = datetime.now()
          printMsg("SCS lines creation ended at %s" %tEnd.strftime("%H:%M:%S"))
          deltaString = GetElapsedTime(tStart, tEnd)